@@ -0,0 +1,125 @@
+import asyncio
+from functools import wraps
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from argon2 import PasswordHasher
+from argon2.exceptions import VerifyMismatchError
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.util import greenlet_spawn
+
+from .db import db_session
+from .models import Group, User, user_by_username
+from .storage import DefaultDBUserStorage
+
+T = TypeVar("T")
+ph = PasswordHasher()
+
+
+def _awaitable(helper: Callable[..., T]) -> Callable[..., Awaitable[T]]:
+    """Async version of a `User`/`Group` helper; pass the `AsyncEngine` where the helper takes `engine`
+    - Runs the sync helper through SQLAlchemy's greenlet bridge (`greenlet_spawn`): its database IO awaits the async
+      driver, so the event loop keeps serving other requests
+    """
+
+    @wraps(helper)
+    async def run(*args, **kwargs) -> T:
+        args = [x.sync_engine if isinstance(x, AsyncEngine) else x for x in args]
+        kwargs = {k: v.sync_engine if isinstance(v, AsyncEngine) else v for k, v in kwargs.items()}
+        return await greenlet_spawn(helper, *args, **kwargs)
+
+    return run
+
+
+class AsyncGroup:
+    get_all = staticmethod(_awaitable(Group.get_all))
+    get_bits = staticmethod(_awaitable(Group.get_bits))
+    create = staticmethod(_awaitable(Group.create))
+    set_status = staticmethod(_awaitable(Group.set_status))
+    inherit = staticmethod(_awaitable(Group.inherit))
+    disinherit = staticmethod(_awaitable(Group.disinherit))
+
+
+class AsyncUser:
+    get = staticmethod(_awaitable(User.get))
+    get_all = staticmethod(_awaitable(User.get_all))
+    get_page = staticmethod(_awaitable(User.get_page))
+    update = staticmethod(_awaitable(User.update))
+    get_groups = staticmethod(_awaitable(User.get_groups))
+    get_effective_groups = staticmethod(_awaitable(User.get_effective_groups))
+    get_effective_permissions = staticmethod(_awaitable(User.get_effective_permissions))
+    add_group = staticmethod(_awaitable(User.add_group))
+    delete_group = staticmethod(_awaitable(User.delete_group))
+    add_groups = staticmethod(_awaitable(User.add_groups))
+    delete_groups = staticmethod(_awaitable(User.delete_groups))
+    set_status = staticmethod(_awaitable(User.set_status))
+
+    @staticmethod
+    async def create(
+        first_name: str, last_name: str, email: str, username: str, password: str, engine: AsyncEngine
+    ) -> bool:
+        """Hashes `password` in the default executor (argon2 is CPU bound), then saves the user"""
+        hashed_password = await _hash(password)
+        create = _awaitable(User.create)
+        return await create(first_name, last_name, email, username, None, engine, hashed_password=hashed_password)
+
+
+class AsyncDBUserStorage:
+    """`DefaultDBUserStorage` for async services (i.e. FastAPI) sharing the admin tables
+    - `db` is an `AsyncEngine` (`sqlite+aiosqlite://...` or `postgresql+asyncpg://...`; the driver must be installed)
+    - Runs the same code as the sync storage (see `_awaitable`); Streamlit keeps using `DefaultDBUserStorage`
+    - Password hashing and verification (argon2, CPU bound) run in the default executor, not on the event loop
+    """
+
+    db: AsyncEngine
+
+    def _storage(self) -> DefaultDBUserStorage:
+        storage = DefaultDBUserStorage()
+        storage.db = self.db.sync_engine
+        return storage
+
+    async def register(self, first_name: str, last_name: str, email: str, username: str, password: str) -> None:
+        await AsyncUser.create(first_name, last_name, email, username, password, self.db)
+
+    async def check_username_exists(self, username: str) -> bool:
+        return await greenlet_spawn(self._storage().check_username_exists, username)
+
+    async def get_username_from_email(self, email: str) -> Optional[str]:
+        return await greenlet_spawn(self._storage().get_username_from_email, email)
+
+    async def change_password(self, email: str, password: str) -> None:
+        hashed_password = await _hash(password)
+        await greenlet_spawn(self._storage()._save_password, email, hashed_password)
+
+    async def init_storage(self) -> None:
+        await greenlet_spawn(self._storage().init_storage)
+
+
+class AsyncDBUserAuth(AsyncDBUserStorage):
+    """`DefaultDBUserAuth` for an `AsyncEngine`
+    - Only checks credentials: async services have no Streamlit session, so no `AuthContext` is set
+    """
+
+    async def check_credentials(self, username: str, password: str) -> bool:
+        user = await greenlet_spawn(_get_active_user, username, self.db.sync_engine)
+        if not user:
+            return False
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, _verify, user.hashed_password, password)
+
+
+def _get_active_user(username: str, engine: Engine) -> Optional[User]:
+    with db_session(engine) as session:
+        user = session.execute(user_by_username(username)).scalars().first()
+    return user if user and user.active is True else None
+
+
+async def _hash(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(None, ph.hash, password)
+
+
+def _verify(hashed_password: str, password: str) -> bool:
+    try:
+        return ph.verify(hashed_password, password)
+    except VerifyMismatchError:
+        return False
@@ -0,0 +1,171 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import func, insert, literal, or_
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, Session, SQLModel, delete, select
+
+from .db import db_session
+from .models import Group, User, UserGroupsLink, _insert_new, _prefix_range
+
+
+class UserArchive(SQLModel, table=True):
+    """Deactivated users moved out of `streamlit_users` by `archive_inactive_users`
+    - Keeps the user's id, so `restore_user` puts the same row back, and their direct groups (`group_ids`)
+    - Usernames/emails stay reserved while archived (see `archived_exists`)
+    """
+
+    __table_args__ = {
+        # 'schema': "apps",
+        "keep_existing": True,
+        # 'extend_existing': True
+    }
+    __tablename__ = "streamlit_users_archive"
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": False})
+    username: str = Field(unique=True)
+    email: str = Field(unique=True)
+    first_name: str
+    last_name: str
+    hashed_password: str
+    active: bool
+    admin: bool = False
+    create_date: datetime
+    created_by: str = "ADMIN"
+    update_date: datetime
+    updated_by: str = "ADMIN"
+    group_ids: str = ""  # comma separated `streamlit_groups` ids
+    archived_at: datetime
+
+    @staticmethod
+    def get_page(
+        engine: Engine, limit: int = 25, after: Optional[str] = None, prefix: Optional[str] = None
+    ) -> Tuple[List["UserArchive"], Optional[str]]:
+        """One page of archived users by username, keyset paginated (see `User.get_page`)"""
+        statement = select(UserArchive)
+        if prefix:
+            statement = statement.where(_prefix_range(func.lower(UserArchive.username), prefix.lower(), engine))
+        if after is not None:
+            statement = statement.where(UserArchive.username > after)
+        with db_session(engine) as session:
+            users = list(session.exec(statement.order_by(UserArchive.username).limit(limit + 1)))
+        if len(users) <= limit:
+            return users, None
+        return users[:limit], users[limit - 1].username
+
+
+def archive_inactive_users(engine: Engine, inactive_days: int = 90, batch_size: int = 500) -> int:
+    """Moves users deactivated (and unchanged) for `inactive_days` into `streamlit_users_archive`
+    - One transaction per batch of `batch_size` users, so the hot table is never locked for long
+    - Safe to run from several processes; a batch another process archived first is skipped
+
+    Returns:
+        int: users archived
+    """
+    cutoff, archived = datetime.now() - timedelta(days=inactive_days), 0
+    while True:
+        try:
+            with db_session(engine, write=True) as session:
+                statement = select(User).where(User.active == False, User.update_date < cutoff)  # noqa: E712
+                users = session.exec(statement.limit(batch_size)).all()
+                if not users:
+                    break
+                ids = [x.id for x in users]
+                groups: Dict[int, List[str]] = {}
+                links = select(UserGroupsLink.user_id, UserGroupsLink.group_id).where(UserGroupsLink.user_id.in_(ids))
+                for user_id, group_id in session.exec(links):
+                    groups.setdefault(user_id, []).append(str(group_id))
+
+                now = datetime.now()
+                rows = [{**x.dict(), "group_ids": ",".join(groups.get(x.id, [])), "archived_at": now} for x in users]
+                session.execute(insert(UserArchive), rows)
+                options = {"synchronize_session": False}
+                for statement in (
+                    delete(UserGroupsLink).where(UserGroupsLink.user_id.in_(ids)),
+                    delete(User).where(User.id.in_(ids)),
+                ):
+                    session.execute(statement, execution_options=options)
+                session.commit()
+        except IntegrityError:
+            logger.info("User archive batch already archived by another process")
+            break
+        _users_removed(ids, engine)
+        archived += len(ids)
+        if len(ids) < batch_size:
+            break
+    if archived:
+        logger.info(f"Archived {archived} inactive user(s)")
+    return archived
+
+
+def restore_user(username: str, session: Session) -> Optional[User]:
+    """Moves an archived user (and their groups that still exist) back into `streamlit_users`; caller commits
+    - Returns None if the user isn't archived, or their username/email has since been reused
+    """
+    archived = session.exec(select(UserArchive).where(UserArchive.username == username)).first()
+    if not archived:
+        return None
+    values = archived.dict(exclude={"group_ids", "archived_at"})
+    if _insert_new(session, User, values, keys=["username", "email"]) is None:
+        logger.warning(f"Can't restore archived user {username}: username or email in use")
+        return None
+    if group_ids := [int(x) for x in archived.group_ids.split(",") if x]:
+        now = datetime.now()
+        links = select(Group.id, literal(archived.id), literal(now), literal("ADMIN"), literal(now), literal("ADMIN"))
+        session.execute(
+            insert(UserGroupsLink).from_select(
+                ["group_id", "user_id", "create_date", "created_by", "update_date", "updated_by"],
+                links.where(Group.id.in_(group_ids)),
+            )
+        )
+    session.delete(archived)
+    session.flush()
+    return session.exec(select(User).where(User.username == username)).first()
+
+
+def archived_exists(session: Session, username: str = None, email: str = None) -> bool:
+    """Whether an archived user holds `username` or `email`"""
+    matches = []
+    if username:
+        matches.append(UserArchive.username == username)
+    if email:
+        matches.append(UserArchive.email == email)
+    return bool(matches) and session.exec(select(UserArchive.id).where(or_(*matches))).first() is not None
+
+
+def get_archived_by_email(email: str, session: Session) -> Optional[UserArchive]:
+    return session.exec(select(UserArchive).where(UserArchive.email == email)).first()
+
+
+def _users_removed(ids: List[int], engine: Engine) -> None:
+    """Keeps the user search index in sync"""
+    from .search import get_user_search
+
+    get_user_search(engine).users_removed(ids)
+
+
+_archivers: Dict[Engine, threading.Thread] = {}
+_archivers_lock = threading.Lock()
+
+
+def start_archiver(engine: Engine, inactive_days: int, interval_secs: float = 3600.0, batch_size: int = 500) -> None:
+    """Runs `archive_inactive_users` every `interval_secs` on a background (daemon) thread; one per engine
+    - The first run waits one interval, so it never races `init_storage`
+    """
+
+    def run():
+        while True:
+            time.sleep(interval_secs)
+            try:
+                archive_inactive_users(engine, inactive_days, batch_size)
+            except Exception as e:
+                logger.exception(f"User archive job failed: {e}")
+
+    with _archivers_lock:
+        if engine not in _archivers:
+            _archivers[engine] = threading.Thread(target=run, name="streamlit-users-archiver", daemon=True)
+            _archivers[engine].start()
@@ -0,0 +1,198 @@
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from loguru import logger
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlmodel import Session
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Open sessions by engine. A context variable rather than a thread local: Streamlit runs a script run (and its
+# callbacks) on one thread, while async callers (see `aio.py`) interleave tasks on one thread, each in its own context.
+# Never mutated in place, so copied contexts can't see each other's sessions.
+_scopes: ContextVar[Dict[object, tuple]] = ContextVar("db_session_scopes", default={})
+
+
+class EngineRouter:
+    """Routes queries by intent: writes to the `primary` engine, reads round-robin across healthy `replicas`
+    - Read-your-writes: after a write, reads from the same browser session go to the primary for `pin_secs`
+    - A replica whose query fails is pinged; if the ping fails it is skipped for `retry_secs`, then pinged again
+      before it serves reads
+    - With no healthy replicas, reads go to the primary
+    """
+
+    def __init__(
+        self, primary: Engine, replicas: Iterable[Engine] = (), pin_secs: float = 5.0, retry_secs: float = 30.0
+    ):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.pin_secs = pin_secs
+        self.retry_secs = retry_secs
+        self._turn = itertools.count()
+        self._down: Dict[Engine, float] = {}
+        self._pins: Dict[Optional[str], float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def engines(self) -> List[Engine]:
+        return [self.primary, *self.replicas]
+
+    def writer(self) -> Engine:
+        return self.primary
+
+    def reader(self) -> Engine:
+        if self.pinned():
+            return self.primary
+        healthy = [x for x in self.replicas if self._healthy(x)]
+        if not healthy:
+            return self.primary
+        return healthy[next(self._turn) % len(healthy)]
+
+    def pin(self) -> None:
+        """Sends this browser session's reads to the primary for `pin_secs` (called after each write)"""
+        now = time.monotonic()
+        with self._lock:
+            self._pins = {k: v for k, v in self._pins.items() if v > now}
+            self._pins[_session_id()] = now + self.pin_secs
+
+    def pinned(self) -> bool:
+        return self._pins.get(_session_id(), 0.0) > time.monotonic()
+
+    def failed(self, engine: Engine) -> None:
+        """Health check after a failed query; a replica that doesn't answer is taken out of rotation"""
+        if engine is self.primary or engine in self._down:
+            return
+        if not _ping(engine):
+            self._down[engine] = time.monotonic() + self.retry_secs
+            logger.warning(f"Read replica {engine.url!r} is down; retrying in {self.retry_secs}s")
+
+    def _healthy(self, engine: Engine) -> bool:
+        retry_at = self._down.get(engine)
+        if retry_at is None:
+            return True
+        if retry_at > time.monotonic():
+            return False
+        with self._lock:
+            if self._down.get(engine) != retry_at:  # another thread is (or was) checking it
+                return engine not in self._down
+            self._down[engine] = time.monotonic() + self.retry_secs
+        if _ping(engine):
+            self._down.pop(engine, None)
+            logger.info(f"Read replica {engine.url!r} is back")
+            return True
+        return False
+
+
+def _ping(engine: Engine) -> bool:
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except DBAPIError:
+        return False
+
+
+def _session_id() -> Optional[str]:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else None
+
+
+def primary_engine(engine: Union[Engine, EngineRouter]) -> Engine:
+    """Engine for DDL, migrations and other schema work"""
+    return engine.primary if isinstance(engine, EngineRouter) else engine
+
+
+@contextmanager
+def db_session(engine: Union[Engine, EngineRouter], write: bool = False) -> Iterator[Session]:
+    """Unit-of-work session shared by the admin `User`/`Group` helpers
+    - The outermost `db_session` opens the session; nested calls on the same engine join it, so a page rendered
+      inside `with db_session(engine):` checks out one connection per transaction instead of one per helper
+    - The session is closed (its connection returned to the pool) when the outermost block exits
+    - `expire_on_commit=False`, so objects loaded earlier in the run stay readable after a helper commits
+    - With an `EngineRouter`, `write=True` sessions run on the primary and pin the browser session's reads to it;
+      reads join an open read session unless pinned. A write nested in a replica read session gets its own session.
+    """
+    router = engine if isinstance(engine, EngineRouter) else None
+    scopes = _scopes.get()
+    outer = scopes.get(engine)
+    if router is None:
+        target = engine
+    elif write:
+        target = router.writer()
+    elif outer is not None and not router.pinned():
+        target = outer[0]
+    else:
+        target = router.reader()
+
+    if outer is not None and outer[0] is target:
+        session = outer[1]
+        try:
+            yield session
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+        if router and write:
+            router.pin()
+        return
+
+    with Session(target, expire_on_commit=False) as session:
+        token = _scopes.set({**scopes, engine: (target, session)})
+        try:
+            yield session
+        except SQLAlchemyError as e:
+            session.rollback()
+            if router and isinstance(e, DBAPIError):
+                router.failed(target)
+            raise
+        finally:
+            _scopes.reset(token)
+    if router and write:
+        router.pin()
+
+
+class QueryCounter:
+    def __init__(self, engines: Iterable[Engine]):
+        self.engines = frozenset(engines)
+        self.count = 0
+        self.statements: List[str] = []
+
+
+# Active `count_queries` blocks; like `_scopes`, per context (thread / asyncio task) and never mutated in place
+_counters: ContextVar[Tuple[QueryCounter, ...]] = ContextVar("db_query_counters", default=())
+_counted_lock = threading.Lock()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    for counter in _counters.get():
+        if conn.engine in counter.engines:
+            counter.count += 1
+            counter.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine: Union[Engine, EngineRouter], label: str = None) -> Iterator[QueryCounter]:
+    """Counts SQL statements the current context (thread / asyncio task) executes on `engine` (every engine of a
+    router) inside the block
+    - Other sessions' (threads') queries aren't counted
+    - With a `label`, the count is logged when the block exits
+    - The listener is added to each engine once and never removed: removing listeners while other threads may be
+      firing the event isn't supported by SQLAlchemy
+    """
+    engines = engine.engines if isinstance(engine, EngineRouter) else [engine]
+    with _counted_lock:
+        for x in engines:
+            if not event.contains(x, "before_cursor_execute", _count_query):
+                event.listen(x, "before_cursor_execute", _count_query)
+    counter = QueryCounter(engines)
+    token = _counters.set((*_counters.get(), counter))
+    try:
+        yield counter
+    finally:
+        _counters.reset(token)
+        if label:
+            logger.debug(f"{label}: {counter.count} queries")
@@ -0,0 +1,124 @@
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import Index, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Field, SQLModel
+
+from .models import (
+    GROUP_CLOSURE_EFFECTIVE_INDEX,
+    USER_ACTIVE_INDEX,
+    USER_GROUPS_USER_INDEX,
+    USER_LOWER_INDEXES,
+    User,
+)
+
+
+class SchemaMigration(SQLModel, table=True):
+    """Applied schema migrations (one row per `Migration.version`)"""
+
+    __table_args__ = {
+        # 'schema': "apps",
+        "keep_existing": True,
+        # 'extend_existing': True
+    }
+    __tablename__ = "streamlit_schema_migrations"
+
+    version: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": False})
+    name: str
+    applied_at: datetime
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+def _create_indexes(*indexes: Index) -> Callable[[Connection], None]:
+    def apply(conn: Connection) -> None:
+        for index in indexes:
+            if not _index_exists(conn, index):
+                index.create(conn)
+
+    return apply
+
+
+def _recreate_indexes(dialect: str, *indexes: Index) -> Callable[[Connection], None]:
+    """Drops and recreates `indexes` from their current definitions, on `dialect` databases only"""
+
+    def apply(conn: Connection) -> None:
+        if conn.dialect.name != dialect:
+            return
+        for index in indexes:
+            if _index_exists(conn, index):
+                index.drop(conn)
+            index.create(conn)
+
+    return apply
+
+
+def _index_exists(conn: Connection, index: Index) -> bool:
+    """Catalog lookup by name; SQLAlchemy's reflection skips expression (i.e. lower()) indexes"""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        statement = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+    elif dialect == "postgresql":
+        statement = "SELECT 1 FROM pg_indexes WHERE indexname = :name"
+    elif dialect == "oracle":
+        statement = "SELECT 1 FROM user_indexes WHERE index_name = UPPER(:name)"
+    else:
+        return any(x["name"] == index.name for x in inspect(conn).get_indexes(index.table.name))
+    return conn.execute(text(statement), {"name": index.name}).first() is not None
+
+
+def _stamp_inactive_users(conn: Connection) -> None:
+    """Users deactivated before deactivation stamped `update_date` still carry the class-definition default, so
+    `archive_inactive_users` would archive recently deactivated users; their inactivity counts from the upgrade"""
+    conn.execute(update(User.__table__).where(User.active == False).values(update_date=datetime.now()))  # noqa: E712
+
+
+# Append only: never edit or reorder an applied step, add a new version instead
+MIGRATIONS: List[Migration] = [
+    Migration(1, "users_active_index", _create_indexes(USER_ACTIVE_INDEX)),
+    Migration(2, "users_lower_search_indexes", _create_indexes(*USER_LOWER_INDEXES)),
+    Migration(3, "user_groups_reverse_index", _create_indexes(USER_GROUPS_USER_INDEX)),
+    Migration(4, "group_closure_reverse_index", _create_indexes(GROUP_CLOSURE_EFFECTIVE_INDEX)),
+    Migration(5, "stamp_inactive_users_update_date", _stamp_inactive_users),
+    Migration(6, "users_lower_pattern_ops_indexes", _recreate_indexes("postgresql", *USER_LOWER_INDEXES)),
+]
+
+
+def migrate(engine: Engine) -> List[int]:
+    """Applies pending migrations in version order; called by `init_storage` (safe to run repeatedly)
+    - Each step is committed together with its `streamlit_schema_migrations` row (where the database
+      supports transactional DDL), so a failed step is retried on the next run
+    - If another process applies a step at the same time, its version row wins and the step is skipped
+
+    Returns:
+        List[int]: versions applied by this call
+    """
+    SchemaMigration.__table__.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(SchemaMigration.version)).scalars())
+
+    versions = []
+    for migration in sorted(MIGRATIONS, key=lambda x: x.version):
+        if migration.version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                migration.apply(conn)
+                conn.execute(
+                    insert(SchemaMigration).values(
+                        version=migration.version, name=migration.name, applied_at=datetime.now()
+                    )
+                )
+        except IntegrityError:
+            logger.info(f"Migration {migration.version} ({migration.name}) already applied by another process")
+            continue
+        logger.info(f"Applied migration {migration.version} ({migration.name})")
+        versions.append(migration.version)
+    return versions
@@ -1,13 +1,29 @@
+import os
+import sys
+import threading
+import time
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Set, Tuple, Type
 
 from argon2 import PasswordHasher
+from sqlalchemy import Index, and_, bindparam, func, insert, lambda_stmt, literal, or_, text, true, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import IntegrityError, NoResultFound
-from sqlmodel import Field, Relationship, Session, SQLModel, select
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.sql.lambdas import StatementLambdaElement
+from sqlmodel import Field, Relationship, Session, SQLModel, delete, select
+
+from streamlit_modular_auth._core.permissions import GroupBits, mask_from_ids
+
+from .db import db_session, primary_engine
 
 ph = PasswordHasher()
 
+UserCursor = Tuple[Any, int]  # (sort column value, id) of the last user on a page
+USER_SORT_COLUMNS = {"username": "username", "last name": "last_name", "email": "email", "created": "create_date"}
+
 
 class UserGroupsLink(SQLModel, table=True):
     __table_args__ = {
@@ -24,6 +40,62 @@ class UserGroupsLink(SQLModel, table=True):
     updated_by: str = "ADMIN"
 
 
+class GroupInheritance(SQLModel, table=True):
+    """Members of `group_id` also receive the permissions of `inherits_id`"""
+
+    __table_args__ = {
+        # 'schema': "apps",
+        "keep_existing": True,
+        # 'extend_existing': True
+    }
+    __tablename__ = "streamlit_group_inheritance"
+
+    group_id: Optional[int] = Field(default=None, foreign_key="streamlit_groups.id", primary_key=True)
+    inherits_id: Optional[int] = Field(default=None, foreign_key="streamlit_groups.id", primary_key=True)
+    create_date: Optional[datetime] = datetime.now()
+    created_by: str = "ADMIN"
+
+
+class GroupClosure(SQLModel, table=True):
+    """Precomputed transitive closure of `GroupInheritance`: every group `group_id` grants (including itself)
+    - Maintained by `_refresh_closure`; never edit directly
+    """
+
+    __table_args__ = {
+        # 'schema': "apps",
+        "keep_existing": True,
+        # 'extend_existing': True
+    }
+    __tablename__ = "streamlit_group_closure"
+
+    group_id: Optional[int] = Field(default=None, foreign_key="streamlit_groups.id", primary_key=True)
+    effective_id: Optional[int] = Field(default=None, foreign_key="streamlit_groups.id", primary_key=True)
+
+
+class GroupCatalogVersion(SQLModel, table=True):
+    """Change counter for groups (a single row): the catalog, memberships and inheritance
+    - Bumped in the same transaction as the change; every process and replica reads it (see `Group.get_version`)
+    """
+
+    __table_args__ = {
+        # 'schema': "apps",
+        "keep_existing": True,
+        # 'extend_existing': True
+    }
+    __tablename__ = "streamlit_group_catalog_version"
+
+    id: Optional[int] = Field(default=None, primary_key=True, sa_column_kwargs={"autoincrement": False})
+    version: int = 0
+
+
+class GroupInfo(NamedTuple):
+    """A group as cached by the `GroupCatalog` (see `Group.get_all`)"""
+
+    id: int
+    name: str
+    active: bool
+
+
 class Group(SQLModel, table=True):
     __table_args__ = {
         # 'schema': "apps",
@@ -43,40 +115,85 @@ class Group(SQLModel, table=True):
     users: List["User"] = Relationship(back_populates="groups", link_model=UserGroupsLink)
 
     @staticmethod
-    def get_all(engine: Engine) -> List["Group"]:
-        with Session(engine.connect()) as session:
-            statement = select(Group)
-            groups = session.exec(statement)
-            return list(groups)
+    def get_all(engine: Engine) -> List[GroupInfo]:
+        """Every group's id, name and active status, from the engine's `GroupCatalog`"""
+        return list(get_group_catalog(engine).get(engine))
 
     @staticmethod
-    def create(name: str, engine: Engine):
-        try:
-            group = Group(name=name)
-            with Session(engine.connect()) as session:
-                session.add(group)
-                session.commit()
-        except IntegrityError as e:
-            if "UNIQUE" not in str(e):
-                raise IntegrityError(e) from e
-            print(f"Group with name {group.name} already exists.")
-            return False
+    def get_bits(engine: Engine) -> GroupBits:
+        """Group name -> bit position catalog, from the engine's `GroupCatalog`"""
+        return get_group_catalog(engine).bits(engine)
+
+    @staticmethod
+    def get_version(engine: Engine) -> int:
+        """Groups version counter; moves on every catalog, membership or inheritance change (see `GroupCatalog`)"""
+        return get_group_catalog(engine).get_version(engine)
+
+    @staticmethod
+    def create(name: str, engine: Engine) -> bool:
+        """Returns False if a group with `name` already exists"""
+        group = Group(name=name)
+        with db_session(engine, write=True) as session:
+            group.id = _insert_new(session, Group, group.dict(exclude={"id"}), keys=["name"])
+            if group.id is None:
+                print(f"Group with name {group.name} already exists.")
+                return False
+            _refresh_closure(session, [group.id])
+            _bump_catalog_version(session)
+            session.commit()
+        get_group_catalog(engine).invalidate()
         return True
 
     @staticmethod
     def set_status(status: bool, name: str, engine: Engine):
-        with Session(engine.connect()) as session:
+        with db_session(engine, write=True) as session:
             statement = select(Group).where(Group.name == name)
             if group := session.exec(statement).one():
                 group.active = status
                 session.add(group)
+                _bump_catalog_version(session)
                 session.commit()
+                get_group_catalog(engine).invalidate()
                 return True
             else:
                 return False
                 # import streamlit as st
                 # st.error("Found no record for group.")
 
+    @staticmethod
+    def inherit(name: str, inherits: str, engine: Engine) -> bool:
+        """Members of group `name` also receive the permissions of group `inherits`"""
+        if name == inherits:
+            return False
+        with db_session(engine, write=True) as session:
+            group, parent = _get_group(name, session), _get_group(inherits, session)
+            if not group or not parent:
+                return False
+            if session.get(GroupInheritance, (group.id, parent.id)):
+                return True
+            session.add(GroupInheritance(group_id=group.id, inherits_id=parent.id))
+            session.flush()
+            _refresh_closure(session, [group.id])
+            _bump_catalog_version(session)
+            session.commit()
+        get_group_catalog(engine).invalidate()
+        return True
+
+    @staticmethod
+    def disinherit(name: str, inherits: str, engine: Engine) -> bool:
+        with db_session(engine, write=True) as session:
+            group, parent = _get_group(name, session), _get_group(inherits, session)
+            if not group or not parent:
+                return False
+            if link := session.get(GroupInheritance, (group.id, parent.id)):
+                session.delete(link)
+                session.flush()
+                _refresh_closure(session, [group.id])
+                _bump_catalog_version(session)
+                session.commit()
+                get_group_catalog(engine).invalidate()
+            return True
+
 
 class User(SQLModel, table=True):
     __table_args__ = {
@@ -104,9 +221,9 @@ class User(SQLModel, table=True):
     @staticmethod
     def get(username: str = None, engine: Engine = None) -> "User":
         try:
-            with Session(engine.connect()) as session:
+            with db_session(engine) as session:
                 if username:
-                    if user := _get_user(username, session):
+                    if user := _get_user(username, session, load_groups=True):
                         return user
         except NoResultFound:
             pass
@@ -114,8 +231,8 @@ class User(SQLModel, table=True):
 
     @staticmethod
     def get_all(engine: Engine) -> List["User"]:
-        with Session(engine.connect()) as session:
-            statement = select(User)
+        with db_session(engine) as session:
+            statement = select(User).options(selectinload(User.groups))
             if users := session.exec(statement):
                 return list(users)
         return None
@@ -123,7 +240,61 @@ class User(SQLModel, table=True):
         # st.error("Found no users.")
 
     @staticmethod
-    def create(first_name: str, last_name: str, email: str, username: str, password: str, engine: Engine):
+    def get_page(
+        engine: Engine,
+        limit: int = 25,
+        after: Optional[UserCursor] = None,
+        sort: str = "username",
+        descending: bool = False,
+        active: Optional[bool] = None,
+        group: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ) -> Tuple[List["User"], Optional[UserCursor]]:
+        """One page of users, keyset paginated; sorting and filtering run in SQL
+        - `after` is the cursor returned with the previous page; returns the page and the next page's cursor (None
+          on the last page)
+        - Keyset (sort value, id) pagination costs the same on every page, unlike OFFSET
+        - Filters: `active` status, member of `group` (direct), username/email starting with `prefix`
+        """
+        column = getattr(User, USER_SORT_COLUMNS[sort])
+        statement = select(User).options(selectinload(User.groups))
+        if active is not None:
+            statement = statement.where(User.active == active)
+        if group:
+            members = select(UserGroupsLink.user_id).join(Group, Group.id == UserGroupsLink.group_id)
+            statement = statement.where(User.id.in_(members.where(Group.name == group)))
+        if prefix:
+            prefix = prefix.lower()
+            statement = statement.where(
+                or_(
+                    _prefix_range(func.lower(User.username), prefix, engine),
+                    _prefix_range(func.lower(User.email), prefix, engine),
+                )
+            )
+        if after is not None:
+            value, user_id = after
+            if descending:
+                statement = statement.where(or_(column < value, and_(column == value, User.id < user_id)))
+            else:
+                statement = statement.where(or_(column > value, and_(column == value, User.id > user_id)))
+        order = (column.desc(), User.id.desc()) if descending else (column, User.id)
+        with db_session(engine) as session:
+            users = list(session.exec(statement.order_by(*order).limit(limit + 1)))
+        if len(users) <= limit:
+            return users, None
+        users = users[:limit]
+        return users, (getattr(users[-1], USER_SORT_COLUMNS[sort]), users[-1].id)
+
+    @staticmethod
+    def create(
+        first_name: str,
+        last_name: str,
+        email: str,
+        username: str,
+        password: str,
+        engine: Engine,
+        hashed_password: str = None,
+    ) -> bool:
         """
         Saves the information of the new user in SQLModel database (SQLite)
         Args:
@@ -131,8 +302,9 @@ class User(SQLModel, table=True):
             email (str): email for new account
             username (str): username for new account
             password (str): password for new account
+            hashed_password (str, Optional): `password`, already hashed (i.e. off the event loop; see `aio.py`)
         Return:
-            None
+            bool: False if the username or email already exists
         """
         ph = PasswordHasher()
         user = User(
@@ -140,16 +312,24 @@ class User(SQLModel, table=True):
             email=email,
             first_name=first_name,
             last_name=last_name,
-            hashed_password=ph.hash(password),
+            hashed_password=hashed_password or ph.hash(password),
             active=True,
         )
-        with Session(engine.connect()) as session:
-            session.add(user)
+        from .archive import archived_exists
+
+        with db_session(engine, write=True) as session:
+            if archived_exists(session, username=username, email=email):
+                return False
+            user.id = _insert_new(session, User, user.dict(exclude={"id"}), keys=["username", "email"])
             session.commit()
+        if user.id is None:
+            return False
+        _user_saved(user, engine)
+        return True
 
     @staticmethod
     def update(user: "User", engine: Engine) -> None:
-        with Session(engine.connect()) as session:
+        with db_session(engine, write=True) as session:
             if saved_user := _get_user(user.username, session):
                 saved_user.active = user.active
                 saved_user.email = user.email
@@ -158,27 +338,46 @@ class User(SQLModel, table=True):
                 saved_user.active = user.active
                 # saved_user.ldap = user.ldap
                 saved_user.admin = user.admin
+                saved_user.update_date = datetime.now()
             session.add(saved_user)
             session.commit()
+        _user_saved(saved_user, engine)
 
     @staticmethod
     def get_groups(username: str, engine: Engine):
-        with Session(engine.connect()) as session:
-            if user := _get_user(username, session):
+        with db_session(engine) as session:
+            statement = select(User).where(User.username == username).options(joinedload(User.groups))
+            if user := session.exec(statement).unique().first():
                 return [x.name for x in user.groups] if user.groups else []
             else:
                 return None
                 # st.error("Found no record for user.")
 
+    @staticmethod
+    def get_effective_groups(username: str, engine: Engine) -> List[str]:
+        """Names of all groups granted to a user, directly or through inheritance"""
+        with db_session(engine) as session:
+            _, groups = _get_user_effective_groups(username, session)
+            return [name for _, name in groups]
+
+    @staticmethod
+    def get_effective_permissions(username: str, engine: Engine) -> Tuple[List[str], int]:
+        """Effective group names and bitset for a user"""
+        with db_session(engine) as session:
+            _, groups = _get_user_effective_groups(username, session)
+            return [name for _, name in groups], mask_from_ids(group_id for group_id, _ in groups)
+
     @staticmethod
     def add_group(username: str, groups: str, engine: Engine) -> None:
-        with Session(engine.connect()) as session:
+        with db_session(engine, write=True) as session:
             group_statement = select(Group).where(Group.name == groups)
             group = session.exec(group_statement).one()
             if user := _get_user(username, session):
                 user.groups.append(group)
                 session.add(user)
+                _bump_catalog_version(session)
                 session.commit()
+                get_group_catalog(engine).invalidate()
                 return True
             else:
                 return False
@@ -187,40 +386,374 @@ class User(SQLModel, table=True):
 
     @staticmethod
     def delete_group(username: str, group: str, engine: Engine):
-        with Session(engine.connect()) as session:
+        with db_session(engine, write=True) as session:
             group_statement = select(Group).where(Group.name == group)
             group = session.exec(group_statement).one()
             if user := _get_user(username, session):
                 if user.groups:
                     user.groups.remove(group)
                     session.add(user)
+                    _bump_catalog_version(session)
                     session.commit()
+                    get_group_catalog(engine).invalidate()
                     return True
             else:
                 return False
                 # import streamlit as st
                 # st.error("Found no record for user.")
 
+    @staticmethod
+    def add_groups(usernames: Iterable[str], groups: Iterable[str], engine: Engine) -> int:
+        """Grants every group to every user, set-based (INSERT ... SELECT) in one transaction
+        - Unknown usernames/groups and existing memberships are skipped
+
+        Returns:
+            int: memberships added
+        """
+        groups, added, now = list(set(groups)), 0, datetime.now()
+        with db_session(engine, write=True) as session:
+            for chunk in _chunks(set(usernames)):
+                existing = select(UserGroupsLink.user_id).where(
+                    UserGroupsLink.user_id == User.id, UserGroupsLink.group_id == Group.id
+                )
+                pairs = (
+                    select(Group.id, User.id, literal(now), literal("ADMIN"), literal(now), literal("ADMIN"))
+                    .select_from(User)
+                    .join(Group, true())  # every user x every group
+                    .where(User.username.in_(chunk), Group.name.in_(groups), ~existing.exists())
+                )
+                statement = insert(UserGroupsLink).from_select(
+                    ["group_id", "user_id", "create_date", "created_by", "update_date", "updated_by"], pairs
+                )
+                added += session.execute(statement).rowcount
+            if added:
+                _bump_catalog_version(session)
+            session.commit()
+        if added:
+            get_group_catalog(engine).invalidate()
+        return added
+
+    @staticmethod
+    def delete_groups(usernames: Iterable[str], groups: Iterable[str], engine: Engine) -> int:
+        """Removes every group from every user, set-based (one DELETE per chunk) in one transaction
+
+        Returns:
+            int: memberships removed
+        """
+        group_ids = select(Group.id).where(Group.name.in_(list(set(groups))))
+        removed = 0
+        with db_session(engine, write=True) as session:
+            for chunk in _chunks(set(usernames)):
+                user_ids = select(User.id).where(User.username.in_(chunk))
+                statement = delete(UserGroupsLink).where(
+                    UserGroupsLink.user_id.in_(user_ids), UserGroupsLink.group_id.in_(group_ids)
+                )
+                removed += session.execute(statement, execution_options={"synchronize_session": False}).rowcount
+            if removed:
+                _bump_catalog_version(session)
+            session.commit()
+        if removed:
+            get_group_catalog(engine).invalidate()
+        return removed
+
     @staticmethod
     def set_status(status: bool, username: str, engine: Engine):
-        with Session(engine.connect()) as session:
-            if user := _get_user(username, session):
+        """Reactivating an archived user restores them (see `archive.py`)"""
+        from .archive import restore_user
+
+        with db_session(engine, write=True) as session:
+            user, restored = session.execute(user_by_username(username)).scalars().first(), False
+            if user is None and status is True:
+                user = restore_user(username, session)
+                restored = user is not None
+            if user:
                 user.active = status
+                user.update_date = datetime.now()  # archival counts inactivity from here
                 session.add(user)
+                if restored:
+                    _bump_catalog_version(session)
                 session.commit()
-                return True
             else:
                 return False
                 # import streamlit as st
                 # st.error("Found no record for user.")
+        if restored:
+            _user_saved(user, engine)
+            get_group_catalog(engine).invalidate()
+        return True
+
+
+# Secondary indexes for hot queries; created with new tables, and on existing databases by the migrations
+# (see `migrations.py`). Names fit Oracle's 30 character limit.
+USER_SEARCH_COLUMNS = ("username", "email", "first_name", "last_name")
+USER_ACTIVE_INDEX = Index("ix_users_active", User.active)
+# `text_pattern_ops` on Postgres, so the indexes serve prefix LIKEs whatever the database collation (`_prefix_range`)
+USER_LOWER_INDEXES = [
+    Index(
+        f"ix_users_lower_{x}",
+        func.lower(getattr(User, x)).label(f"lower_{x}"),
+        postgresql_ops={f"lower_{x}": "text_pattern_ops"},
+    )
+    for x in USER_SEARCH_COLUMNS
+]
+USER_GROUPS_USER_INDEX = Index("ix_user_groups_user_id", UserGroupsLink.user_id)
+GROUP_CLOSURE_EFFECTIVE_INDEX = Index("ix_group_closure_effective", GroupClosure.effective_id)
+
+
+class _CatalogSnapshot(NamedTuple):
+    version: int
+    groups: List[GroupInfo]
+    bits: GroupBits
+
+
+class GroupCatalog:
+    """Cache of every group's (id, name, active), and the groups version counter, of one database (see
+    `get_group_catalog`)
+    - Reloaded when `streamlit_group_catalog_version` changes: checking it is one primary key lookup, at most once
+      per `check_secs`; on file SQLite databases it's skipped unless the database file changed (a local stat)
+    - This process's own group changes invalidate it immediately
+    - The database is read without holding the lock (async callers run helpers on the event loop thread, see
+      `aio.py`); the lock only guards swapping in the new snapshot
+    """
+
+    def __init__(self, check_secs: float = 1.0):
+        self.check_secs = check_secs
+        self._snapshot: Optional[_CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._file_stamp: Optional[tuple] = None
+        self._generation = 0  # bumped by `invalidate`, so a load that raced it isn't trusted for `check_secs`
+        self._lock = threading.Lock()
+
+    def get(self, engine: Engine) -> List[GroupInfo]:
+        return self._load(engine).groups
+
+    def get_version(self, engine: Engine) -> int:
+        return self._load(engine).version
+
+    def bits(self, engine: Engine) -> GroupBits:
+        return self._load(engine).bits
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._checked_at = 0.0
+            self._file_stamp = None
+
+    def _load(self, engine: Engine) -> _CatalogSnapshot:
+        snapshot, generation = self._snapshot, self._generation
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_secs:
+            return snapshot
+        stamp = _sqlite_file_stamp(engine)
+        if snapshot is not None and stamp is not None and stamp == self._file_stamp:
+            with self._lock:
+                if generation == self._generation:
+                    self._checked_at = time.monotonic()
+            return snapshot
+        with db_session(engine) as session:
+            version = _get_catalog_version(session)
+            if snapshot is None or version != snapshot.version:
+                statement = select(Group.id, Group.name, Group.active).order_by(Group.name)
+                groups = [GroupInfo(*x) for x in session.exec(statement)]
+                snapshot = _CatalogSnapshot(version, groups, GroupBits({name: x for x, name, _ in groups}))
+        with self._lock:
+            if generation == self._generation:
+                self._snapshot, self._file_stamp, self._checked_at = snapshot, stamp, time.monotonic()
+        return snapshot
+
+
+_catalogs: Dict[Engine, GroupCatalog] = {}
+
+
+def get_group_catalog(engine: Engine) -> GroupCatalog:
+    """Process-wide `GroupCatalog` per primary engine (an `EngineRouter`'s replicas share the primary's)"""
+    key = primary_engine(engine)
+    if key not in _catalogs:
+        _catalogs.setdefault(key, GroupCatalog())
+    return _catalogs[key]
+
+
+def _get_catalog_version(session: Session) -> int:
+    statement = lambda_stmt(lambda: select(GroupCatalogVersion.version).where(GroupCatalogVersion.id == 1))
+    return session.execute(statement).scalar() or 0
+
+
+def _bump_catalog_version(session: Session) -> None:
+    """Caller commits (so the bump is part of the group change's transaction), then invalidates the engine's catalog"""
+    statement = (
+        update(GroupCatalogVersion)
+        .where(GroupCatalogVersion.id == 1)
+        .values(version=GroupCatalogVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    if not session.execute(statement).rowcount:
+        _insert_new(session, GroupCatalogVersion, {"id": 1, "version": 1}, keys=["id"])
+
+
+def _sqlite_file_stamp(engine: Engine) -> Optional[tuple]:
+    """mtime/size of a SQLite database file and its WAL (None for other databases and in-memory SQLite)"""
+    url = primary_engine(engine).url
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    stamp = []
+    for path in (url.database, url.database + "-wal"):
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+def _get_group(name: str, session: Session) -> Optional[Group]:
+    return session.exec(select(Group).where(Group.name == name)).first()
+
+
+def _insert_new(session: Session, model: Type[SQLModel], values: Dict[str, Any], keys: Sequence[str]) -> Optional[int]:
+    """Inserts a row unless one of its unique `keys` columns already holds the value, in one statement where supported
+    - SQLite (3.24+) and Postgres: INSERT ... ON CONFLICT DO NOTHING (Postgres returns the id via RETURNING)
+    - Oracle: MERGE ... WHEN NOT MATCHED THEN INSERT, then a lookup for the new id
+    - Anything else: INSERT in a SAVEPOINT, rolled back on a unique violation
+    - Caller commits
+
+    Returns:
+        Optional[int]: id of the new row; None if it already existed
+    """
+    table = model.__table__
+    dialect = session.get_bind().dialect
+    if dialect.name == "postgresql":
+        statement = pg_insert(table).values(**values).on_conflict_do_nothing().returning(table.c.id)
+        return session.execute(statement).scalar()
+    if dialect.name == "sqlite" and (dialect.server_version_info or (0,)) >= (3, 24):
+        result = session.execute(sqlite_insert(table).values(**values).on_conflict_do_nothing())
+        return result.inserted_primary_key[0] if result.rowcount else None
+    if dialect.name == "oracle":
+        # No MERGE construct in SQLAlchemy 1.4. Identifiers come from the table (quoted by the dialect); values are
+        # bind parameters typed by their columns, so they get the same processing as an insert (i.e. Boolean -> 0/1)
+        quote = dialect.identifier_preparer.quote
+        columns = [quote(x) for x in values]
+        source = ", ".join(f":p_{x} AS {column}" for x, column in zip(values, columns))
+        matches = " OR ".join(f"t.{quote(x)} = s.{quote(x)}" for x in keys)
+        statement = text(
+            f"MERGE INTO {dialect.identifier_preparer.format_table(table)} t "  # noqa: S608
+            f"USING (SELECT {source} FROM dual) s ON ({matches}) "
+            f"WHEN NOT MATCHED THEN INSERT ({', '.join(columns)}) VALUES ({', '.join(f's.{x}' for x in columns)})"
+        ).bindparams(*[bindparam(f"p_{x}", value, type_=table.c[x].type) for x, value in values.items()])
+        if not session.execute(statement).rowcount:
+            return None
+        return session.execute(select(table.c.id).where(table.c[keys[0]] == values[keys[0]])).scalar()
+    try:
+        with session.begin_nested():
+            return session.execute(insert(table).values(**values)).inserted_primary_key[0]
+    except IntegrityError as e:
+        message = str(e.orig).lower()
+        if "unique" not in message and "duplicate" not in message:
+            raise
+        return None
 
 
-def _get_user(username: str, session: Session) -> "User":
-    user_statement = select(User).where(User.username == username)
-    if user := session.exec(user_statement).one():
+def _chunks(values: Iterable[str], size: int = 500) -> Iterator[List[str]]:
+    """Splits values for IN lists (SQLite/Oracle bind parameter limits)"""
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i : i + size]
+
+
+def _user_saved(user: "User", engine: Engine) -> None:
+    """Keeps the user search index in sync"""
+    from .search import get_user_search
+
+    get_user_search(engine).user_saved(user)
+
+
+def _prefix_range(column: Any, prefix: str, engine: Engine) -> Any:
+    """`column` starts with `prefix`, in a form the column's (lower()) index can serve
+    - Postgres: an escaped `LIKE 'prefix%'`, served by the `text_pattern_ops` indexes; a range would compare with the
+      database collation, which can ignore punctuation (so "ab" would match "a-b")
+    - Others compare in binary order by default: a range, `prefix <= column < next prefix`; a prefix ending in the
+      last code point has no next prefix, so the LIKE bounds it instead
+    """
+    like = column.like(_escape_like(prefix) + "%", escape="/")
+    if primary_engine(engine).dialect.name == "postgresql":
+        return like
+    if ord(prefix[-1]) == sys.maxunicode:
+        return and_(column >= prefix, like)
+    return and_(column >= prefix, column < prefix[:-1] + chr(ord(prefix[-1]) + 1))
+
+
+def _escape_like(value: str) -> str:
+    """For `LIKE ... ESCAPE '/'`; a backslash escape is rendered differently by dialect and server settings"""
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def _get_user_effective_groups(username: str, session: Session) -> Tuple[Optional["User"], List[Tuple[int, str]]]:
+    """User and their effective (group id, group name) pairs in one SELECT (outer joins through the closure)"""
+    statement = lambda_stmt(
+        lambda: select(User, Group.id, Group.name)
+        .outerjoin(UserGroupsLink, UserGroupsLink.user_id == User.id)
+        .outerjoin(GroupClosure, GroupClosure.group_id == UserGroupsLink.group_id)
+        .outerjoin(Group, Group.id == GroupClosure.effective_id)
+        .where(User.username == username)
+    )
+    user, groups = None, {}
+    for user, group_id, name in session.execute(statement):
+        if group_id is not None:
+            groups[group_id] = name
+    return user, list(groups.items())
+
+
+def _refresh_closure(session: Session, changed_ids: Iterable[int] = None) -> None:
+    """Recomputes `GroupClosure` for changed groups and every group that inherits from them
+    - With no `changed_ids`, the closure is rebuilt for all groups
+    - Caller commits
+    """
+    edges: Dict[int, Set[int]] = {}
+    for link in session.exec(select(GroupInheritance)):
+        edges.setdefault(link.group_id, set()).add(link.inherits_id)
+
+    if changed_ids is None:
+        affected = set(session.exec(select(Group.id)))
+    else:
+        changed_ids = set(changed_ids)
+        affected = set(changed_ids)
+        affected.update(session.exec(select(GroupClosure.group_id).where(GroupClosure.effective_id.in_(changed_ids))))
+    if not affected:
+        return
+
+    session.exec(delete(GroupClosure).where(GroupClosure.group_id.in_(affected)))
+    for group_id in affected:
+        effective, stack = {group_id}, [group_id]
+        while stack:
+            for parent_id in edges.get(stack.pop(), ()):
+                if parent_id not in effective:
+                    effective.add(parent_id)
+                    stack.append(parent_id)
+        session.add_all(GroupClosure(group_id=group_id, effective_id=x) for x in effective)
+
+
+def rebuild_group_closure(engine: Engine) -> None:
+    with db_session(engine, write=True) as session:
+        _refresh_closure(session)
+        session.commit()
+
+
+def _get_user(username: str, session: Session, load_groups: bool = False) -> "User":
+    statement = user_by_username(username)
+    if load_groups:
+        statement += lambda s: s.options(selectinload(User.groups))
+    if user := session.execute(statement).scalars().one():
         return user
     return None
 
+
+# Hot lookups (login, registration, password reset) as lambda statements: SQLAlchemy builds each statement and its
+# cache key once per call site, then only swaps in the bound parameter (see `ModularAuth.db_query_cache_size`)
+def user_by_username(username: str) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(User).where(User.username == username))
+
+
+def user_by_email(email: str) -> StatementLambdaElement:
+    return lambda_stmt(lambda: select(User).where(User.email == email))
+
     # def _get_groups(self, username) -> Groups
 
 
@@ -229,7 +762,7 @@ def create_user(engine: Engine):
 
     try:
         group = Group(name="admin")
-        with Session(engine.connect()) as session:
+        with db_session(engine, write=True) as session:
             session.add(group)
             session.commit()
     except IntegrityError:
@@ -246,7 +779,7 @@ def create_user(engine: Engine):
             active=True,
             admin=True,
         )
-        with Session(engine.connect()) as session:
+        with db_session(engine, write=True) as session:
             if user.admin is True:
                 statement = select(Group).where(Group.name == "admin")
                 if admin_group := session.exec(statement).one():
@@ -1,11 +1,18 @@
 import streamlit as st
 
+from .db import count_queries, db_session
 from .views import AdminView
 
 view = AdminView()
 
 
 def admin_page(view: AdminView):
+    """Renders the admin tools; all database helpers used by one render share a single session"""
+    with db_session(view.db), count_queries(view.db, label="Admin page render"):
+        _admin_page(view)
+
+
+def _admin_page(view: AdminView):
     st.markdown("## Admin Tools")
 
     st.markdown("---")
@@ -22,41 +29,58 @@ def admin_page(view: AdminView):
             elif st.session_state["page"].get("create_user"):
                 view.create_user()
             else:
-                users = view.user_get_all()
-                view.users_list(users)
+                view.users_page()
                 if st.button("Create User"):
                     st.session_state["page"]["create_user"] = True
                     st.experimental_rerun()
 
         # ADD GROUP
         with edit_tab:
-            add_group = st.empty()
-            with add_group.form("Add Group"):
-                username = st.text_input("Username")
-                groups = st.text_input("Group")
-                st.markdown("###")
-                add_group_button = st.form_submit_button(label="Add")
-
-            if add_group_button is True:
-                if view.user_add_groups(username, groups):
-                    st.success("Added group(s).")
-
-            # REMOVE GROUP
-            remove_group = st.empty()
-            with remove_group.form("Remove Group"):
-                username = st.text_input("Username")
-                group = st.text_input("Delete Group")
+            with st.form("User Groups"):
+                usernames = st.text_area("Usernames", placeholder="One per line, or comma separated")
+                groups = st.multiselect("Groups", view.group_get_all() or [])
                 st.markdown("###")
-                remove_group_button = st.form_submit_button(label="Remove")
+                add_col, remove_col, _ = st.columns((0.5, 0.5, 2))
+                with add_col:
+                    add_group_button = st.form_submit_button(label="Add")
+                with remove_col:
+                    remove_group_button = st.form_submit_button(label="Remove")
 
-            if remove_group_button is True:
-                if view.user_delete_group(username, group):
-                    st.success("Removed group.")
+            usernames = [x.strip() for x in usernames.replace(",", "\n").splitlines() if x.strip()]
+            if (add_group_button or remove_group_button) and not (usernames and groups):
+                st.warning("Username(s) and group(s) required.")
+            elif add_group_button is True:
+                st.success(f"Added {view.user_add_groups(usernames, groups)} group membership(s).")
+            elif remove_group_button is True:
+                st.success(f"Removed {view.user_delete_groups(usernames, groups)} group membership(s).")
 
         with group_tab:
             groups = view.group_get_all(return_str=False)
             # groups = [x.name for x in groups]
             view.groups_list(groups)
+
+            # GROUP INHERITANCE
+            with st.form("Group Inheritance"):
+                name = st.text_input("Group")
+                inherits = st.text_input("Inherits Permissions Of")
+                st.markdown("###")
+                inherit_col, disinherit_col, _ = st.columns((0.5, 0.5, 2))
+                with inherit_col:
+                    inherit_button = st.form_submit_button(label="Inherit")
+                with disinherit_col:
+                    disinherit_button = st.form_submit_button(label="Remove")
+
+            if inherit_button is True:
+                if view.group_inherit(name, inherits):
+                    st.success(f"Group {name} inherits {inherits}.")
+                else:
+                    st.error("Group(s) not found.")
+            if disinherit_button is True:
+                if view.group_disinherit(name, inherits):
+                    st.success(f"Group {name} no longer inherits {inherits}.")
+                else:
+                    st.error("Group(s) not found.")
+
             if st.button("Add Group") or view.state["page"].get("add_group"):
                 view.state["page"]["add_group"] = True
                 name = st.text_input("Group Name")
@@ -0,0 +1,176 @@
+import bisect
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from loguru import logger
+from sqlalchemy import func, inspect, or_, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import selectinload
+from sqlmodel import select
+
+from .db import EngineRouter, db_session, primary_engine
+from .models import USER_SEARCH_COLUMNS, User, _prefix_range
+
+MIN_SUBSTRING = 3  # trigram indexes can't serve shorter substrings; those use the prefix indexes
+
+SQLITE_FTS = [
+    """CREATE VIRTUAL TABLE streamlit_users_fts USING fts5(
+        username, email, first_name, last_name, content='streamlit_users', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS streamlit_users_fts_ai AFTER INSERT ON streamlit_users BEGIN
+        INSERT INTO streamlit_users_fts(rowid, username, email, first_name, last_name)
+        VALUES (new.id, new.username, new.email, new.first_name, new.last_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS streamlit_users_fts_ad AFTER DELETE ON streamlit_users BEGIN
+        INSERT INTO streamlit_users_fts(streamlit_users_fts, rowid, username, email, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.email, old.first_name, old.last_name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS streamlit_users_fts_au AFTER UPDATE ON streamlit_users BEGIN
+        INSERT INTO streamlit_users_fts(streamlit_users_fts, rowid, username, email, first_name, last_name)
+        VALUES ('delete', old.id, old.username, old.email, old.first_name, old.last_name);
+        INSERT INTO streamlit_users_fts(rowid, username, email, first_name, last_name)
+        VALUES (new.id, new.username, new.email, new.first_name, new.last_name);
+    END""",
+    "INSERT INTO streamlit_users_fts(streamlit_users_fts) VALUES ('rebuild')",
+]
+
+# Must match the indexed expression exactly for Postgres to use the trigram index
+PG_DOCUMENT = "(lower(username) || ' ' || lower(email) || ' ' || lower(first_name) || ' ' || lower(last_name))"
+POSTGRES_TRGM = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_streamlit_users_search_trgm "
+    f"ON streamlit_users USING gin ({PG_DOCUMENT} gin_trgm_ops)",
+]
+# Only the constant document expression is interpolated; the search pattern and limit are bound parameters
+PG_SEARCH = f"SELECT id FROM streamlit_users WHERE {PG_DOCUMENT} LIKE :pattern LIMIT :limit"  # noqa: S608
+
+
+class UserSearch:
+    """Case-insensitive user search (username, email, first/last name) backed by indexes
+    - SQLite: FTS5 trigram table kept in sync by triggers (substring search)
+    - Postgres: pg_trgm GIN index (substring search)
+    - Anything else, or when the extension/tokenizer isn't available: an in-process sorted index (prefix search),
+      loaded once and updated by `User.create`/`User.update`
+    - Terms shorter than `MIN_SUBSTRING` are prefix (range) lookups on the lower() indexes (`USER_LOWER_INDEXES`)
+    """
+
+    def __init__(self, engine: Union[Engine, EngineRouter]):
+        self.engine = engine
+        self.primary = primary_engine(engine)  # schema work and detection; queries go through `db_session`
+        self.backend: Optional[str] = None
+        self._sorted: Optional[List[Tuple[str, int]]] = None
+        self._lock = threading.Lock()
+
+    def setup(self) -> str:
+        """Creates the backend's search index (idempotent); called by `init_storage`"""
+        dialect = self.primary.dialect.name
+        statements = {"sqlite": SQLITE_FTS, "postgresql": POSTGRES_TRGM}.get(dialect)
+        self.backend = "sorted"
+        if self._detect():
+            self.backend = dialect
+        elif statements:
+            try:
+                with self.primary.begin() as conn:
+                    for statement in statements:
+                        conn.execute(text(statement))
+                self.backend = dialect
+            except DBAPIError as e:
+                logger.warning(f"User search index unavailable on {dialect}; using in-process index ({e.orig})")
+        logger.info(f"User search backend: {self.backend}")
+        return self.backend
+
+    def search(self, term: str, limit: int = 20) -> List[User]:
+        term = term.strip().lower()
+        if not term:
+            return []
+        if self.backend is None:
+            self.backend = self.primary.dialect.name if self._detect() else "sorted"
+        if self.backend == "sorted":
+            ids = self._sorted_prefix(term, limit)
+        elif len(term) < MIN_SUBSTRING:
+            ids = self._prefix(term, limit)
+        else:
+            ids = self._substring(term, limit)
+        return self._load(ids)
+
+    def _detect(self) -> bool:
+        """Whether the backend's search index already exists"""
+        names = inspect(self.primary)
+        if self.primary.dialect.name == "sqlite":
+            return names.has_table("streamlit_users_fts")
+        if self.primary.dialect.name == "postgresql":
+            indexes = names.get_indexes("streamlit_users")
+            return any(x["name"] == "ix_streamlit_users_search_trgm" for x in indexes)
+        return False
+
+    def user_saved(self, user: User) -> None:
+        """Keeps the in-process index in sync (database indexes maintain themselves)"""
+        if self._sorted is None:
+            return
+        with self._lock:
+            self._sorted = [x for x in self._sorted if x[1] != user.id]
+            for key in _keys(user):
+                bisect.insort(self._sorted, (key, user.id))
+
+    def users_removed(self, ids: List[int]) -> None:
+        """Drops archived users from the in-process index (database indexes maintain themselves)"""
+        if self._sorted is None:
+            return
+        with self._lock:
+            ids = set(ids)
+            self._sorted = [x for x in self._sorted if x[1] not in ids]
+
+    def _prefix(self, term: str, limit: int) -> List[int]:
+        ranges = [_prefix_range(func.lower(getattr(User, x)), term, self.engine) for x in USER_SEARCH_COLUMNS]
+        with db_session(self.engine) as session:
+            statement = select(User.id).where(or_(*ranges)).limit(limit)
+            return list(session.exec(statement))
+
+    def _substring(self, term: str, limit: int) -> List[int]:
+        if self.backend == "sqlite":
+            statement = text("SELECT rowid FROM streamlit_users_fts WHERE streamlit_users_fts MATCH :term LIMIT :limit")
+            params = {"term": '"' + term.replace('"', '""') + '"', "limit": limit}
+        else:
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            statement = text(PG_SEARCH)
+            params = {"pattern": pattern, "limit": limit}
+        with db_session(self.engine) as session:
+            return [row[0] for row in session.execute(statement, params)]
+
+    def _sorted_prefix(self, term: str, limit: int) -> List[int]:
+        if self._sorted is None:
+            with self._lock:
+                if self._sorted is None:
+                    with db_session(self.engine) as session:
+                        users = session.exec(select(User)).all()
+                    self._sorted = sorted((key, x.id) for x in users for key in _keys(x))
+        ids: Dict[int, None] = {}
+        entries = self._sorted
+        for i in range(bisect.bisect_left(entries, (term, -1)), len(entries)):
+            key, user_id = entries[i]
+            if not key.startswith(term) or len(ids) >= limit:
+                break
+            ids[user_id] = None
+        return list(ids)
+
+    def _load(self, ids: List[int]) -> List[User]:
+        if not ids:
+            return []
+        with db_session(self.engine) as session:
+            users = session.exec(select(User).where(User.id.in_(ids)).options(selectinload(User.groups))).all()
+        return sorted(users, key=lambda x: x.username)
+
+
+def _keys(user: User) -> List[str]:
+    return [getattr(user, x).lower() for x in USER_SEARCH_COLUMNS if getattr(user, x)]
+
+
+_searches: Dict[Union[Engine, EngineRouter], UserSearch] = {}
+
+
+def get_user_search(engine: Union[Engine, EngineRouter]) -> UserSearch:
+    """Process-wide `UserSearch` per engine"""
+    if engine not in _searches:
+        _searches[engine] = UserSearch(engine)
+    return _searches[engine]
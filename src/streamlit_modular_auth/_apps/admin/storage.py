@@ -1,13 +1,31 @@
-from typing import TYPE_CHECKING, Optional
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Dict, FrozenSet, Optional, Tuple, Union
 
 import diskcache
 import streamlit as st
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from sqlalchemy.exc import NoResultFound
-from sqlmodel import Session, select
 
-from streamlit_modular_auth._apps.admin.models import User, create_db_and_tables, create_user
+from streamlit_modular_auth._apps.admin.archive import archived_exists, get_archived_by_email
+from streamlit_modular_auth._apps.admin.db import EngineRouter, db_session, primary_engine
+from streamlit_modular_auth._apps.admin.migrations import migrate
+from streamlit_modular_auth._apps.admin.models import (
+    Group,
+    User,
+    _get_user_effective_groups,
+    create_db_and_tables,
+    create_user,
+    rebuild_group_closure,
+    user_by_email,
+    user_by_username,
+)
+from streamlit_modular_auth._apps.admin.search import get_user_search
+from streamlit_modular_auth._core.context import AuthContext
+from streamlit_modular_auth._core.permissions import mask_from_ids
 
 if TYPE_CHECKING:
     from sqlalchemy.engine import Engine
@@ -18,7 +36,7 @@ ph = PasswordHasher()
 
 
 class DefaultDBUserStorage:
-    db: "Engine"
+    db: Union["Engine", EngineRouter]
 
     def register(self, first_name: str, last_name: str, email: str, username: str, password: str) -> None:
         """
@@ -49,13 +67,13 @@ class DefaultDBUserStorage:
             bool: If username exists -> "True"; if not -> "False"
         """
         try:
-            with Session(self.db.connect()) as session:
-                statement = select(User).where(User.username == username)
-                if user := session.exec(statement).one():
+            with db_session(self.db) as session:
+                if user := session.execute(user_by_username(username)).scalars().one():
                     print(user)
                     return True
         except NoResultFound:
-            return False
+            with db_session(self.db) as session:
+                return archived_exists(session, username=username)
         return False
 
     def get_username_from_email(self, email: str) -> Optional[str]:
@@ -67,12 +85,13 @@ class DefaultDBUserStorage:
             Optional[str]: If exists -> <username>; If not -> None
         """
         try:
-            with Session(self.db.connect()) as session:
-                statement = select(User).where(User.email == email)
-                if user := session.exec(statement).one():
+            with db_session(self.db) as session:
+                if user := session.execute(user_by_email(email)).scalars().one():
                     return user.username
         except NoResultFound:
-            return None
+            with db_session(self.db) as session:
+                archived = get_archived_by_email(email, session)
+                return archived.username if archived else None
         return None
 
     def change_password(self, email: str, password: str) -> None:
@@ -85,20 +104,26 @@ class DefaultDBUserStorage:
             None
         """
         ph = PasswordHasher()
-        with Session(self.db.connect()) as session:
-            statement = select(User).where(User.email == email)
-            if user := session.exec(statement).one():
-                user.hashed_password = ph.hash(password)
+        self._save_password(email, ph.hash(password))
+
+    def _save_password(self, email: str, hashed_password: str) -> None:
+        with db_session(self.db, write=True) as session:
+            user = session.execute(user_by_email(email)).scalars().first() or get_archived_by_email(email, session)
+            if user:
+                user.hashed_password = hashed_password
                 session.add(user)
                 session.commit()
 
     def init_storage(self):
-        create_db_and_tables(self.db)
+        create_db_and_tables(primary_engine(self.db))
+        migrate(primary_engine(self.db))
         create_user(self.db)
+        rebuild_group_closure(self.db)
+        get_user_search(self.db).setup()
 
 
 class DefaultDBUserAuth(DefaultDBUserStorage):
-    db: "Engine"
+    db: Union["Engine", EngineRouter]
     USser: User
 
     def check_credentials(self, username, password):
@@ -111,24 +136,76 @@ class DefaultDBUserAuth(DefaultDBUserStorage):
             bool: If password is correct -> "True"; if not -> "False"
         """
         # MOVE AND GENERIALZE INTO PROTOCOL
-        with Session(self.db.connect()) as session:
+        with db_session(self.db) as session:
             st.write(username)
-            statement = select(User).where(User.username == username)
-            try:
-                user = session.exec(statement).one()
-                if user and user.active is True:
-                    ph = PasswordHasher()
-                    try:
-                        if ph.verify(user.hashed_password, password):
-                            if user.groups:
-                                groups = [x.name for x in user.groups]
-                                st.session_state["groups"] = groups
-                            st.session_state["username"] = username
-                            return True
-                    except VerifyMismatchError as e:
-                        if str(e) != "The password does not match the supplied hash":
-                            raise VerifyMismatchError(e) from e
-            except NoResultFound as e:
-                if "No row was found" not in str(e):
-                    raise NoResultFound(e) from e
+            # One SELECT: the user row plus effective groups (needed for the session) on success
+            user, groups = _get_user_effective_groups(username, session)
+            if user and user.active is True:
+                ph = PasswordHasher()
+                try:
+                    if ph.verify(user.hashed_password, password):
+                        auth = AuthContext.load(st.session_state)
+                        auth.groups_version = Group.get_version(self.db)
+                        auth.set_groups([name for _, name in groups], group_mask=mask_from_ids(x for x, _ in groups))
+                        auth.user_id = user.id
+                        auth.username = username
+                        return True
+                except VerifyMismatchError as e:
+                    if str(e) != "The password does not match the supplied hash":
+                        raise VerifyMismatchError(e) from e
         return False
+
+
+class DefaultDBGroupProvider:
+    """Loads a user's effective groups from the database
+    - Results are cached per process for `ttl` seconds, and dropped early when the groups version changes
+    - At most `max_size` users are cached; the least recently loaded are dropped first
+    - Concurrent misses for the same user share one query (single-flight)
+    """
+
+    db: Union["Engine", EngineRouter]
+
+    def __init__(self, ttl: float = 30.0, max_size: int = 1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._cache: "OrderedDict[str, Tuple[float, int, FrozenSet[str]]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def get_groups(self, username: str) -> FrozenSet[str]:
+        version = Group.get_version(self.db)
+        if (groups := self._cached(username, version)) is not None:
+            return groups
+
+        with self._lock:
+            # A flight that finished while this thread waited for the lock already cached the result
+            if (groups := self._cached(username, version)) is not None:
+                return groups
+            flight = self._inflight.get(username)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[username] = Future()
+        if not leader:
+            return flight.result()
+
+        try:
+            groups = frozenset(User.get_effective_groups(username, self.db))
+            with self._lock:
+                self._cache[username] = (time.monotonic() + self.ttl, version, groups)
+                self._cache.move_to_end(username)
+                while len(self._cache) > self.max_size:
+                    self._cache.popitem(last=False)
+            flight.set_result(groups)
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(username, None)
+        return groups
+
+    def _cached(self, username: str, version: int) -> Optional[FrozenSet[str]]:
+        hit = self._cache.get(username)
+        if hit and hit[0] > time.monotonic() and hit[1] == version:
+            return hit[2]
+        return None
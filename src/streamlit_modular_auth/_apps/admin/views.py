@@ -3,11 +3,12 @@ from typing import List
 
 import streamlit as st
 from argon2 import PasswordHasher
-from sqlalchemy.exc import IntegrityError, NoResultFound
 
 from streamlit_modular_auth._core.views import DefaultBaseView
 
-from .models import Group, User
+from .archive import UserArchive
+from .models import USER_SORT_COLUMNS, Group, GroupInfo, User
+from .search import get_user_search
 
 
 class AdminView(DefaultBaseView):
@@ -114,41 +115,101 @@ class AdminView(DefaultBaseView):
             create_user = st.form_submit_button(label="Create")
 
         if create_user is True:
-            try:
-                User.create(
-                    first_name=first_name,
-                    last_name=last_name,
-                    email=email,
-                    username=username,
-                    password=password,
-                    engine=self.db,
-                )
-                if User.get(username, self.db):
-                    st.success("User created.")
-            except NoResultFound:
-                st.error("An error occurred while attempting to create user.")
-            except IntegrityError:
+            created = User.create(
+                first_name=first_name,
+                last_name=last_name,
+                email=email,
+                username=username,
+                password=password,
+                engine=self.db,
+            )
+            if created:
+                st.success("User created.")
+            else:
                 st.warning("User or email address already exists.")
         if st.button("Close"):
             st.session_state["page"].pop("create_user")
             st.experimental_rerun()
 
+    def users_page(self, page_size: int = 25):
+        """Users list rendered one page at a time; filtering, sorting and paging run in the database"""
+        page_state = st.session_state["page"]
+        if search := st.text_input("Search users", placeholder="Username, email or name"):
+            if users := self.user_search(search):
+                self.users_list(users)
+            else:
+                st.info("No users found.")
+            return
+
+        prefix_col, status_col, group_col, sort_col, order_col = st.columns((1.5, 1, 1, 1, 0.6))
+        prefix = prefix_col.text_input("Username/email starts with")
+        status = status_col.selectbox("Status", ["All", "Active", "Inactive", "Archived"])
+        group = group_col.selectbox("Group", ["All", *(self.group_get_all() or [])])
+        sort = sort_col.selectbox("Sort by", list(USER_SORT_COLUMNS))
+        descending = order_col.checkbox("Descending")
+
+        query = {
+            "sort": sort,
+            "descending": descending,
+            "active": {"Active": True, "Inactive": False}.get(status),
+            "group": None if group == "All" else group,
+            "prefix": prefix or None,
+        }
+        if page_state.get("users_query") != (status, query):
+            page_state["users_query"] = (status, query)
+            page_state["users_cursors"] = [None]
+        cursors = page_state["users_cursors"]
+
+        if status == "Archived":
+            users, next_cursor = UserArchive.get_page(self.db, limit=page_size, after=cursors[-1], prefix=prefix)
+            users_list = self.archived_users_list
+        else:
+            users, next_cursor = User.get_page(self.db, limit=page_size, after=cursors[-1], **query)
+            users_list = self.users_list
+        if users:
+            users_list(users)
+        else:
+            st.info("No users found.")
+
+        prev_col, page_col, next_col, _ = st.columns((0.4, 0.4, 0.4, 2))
+        prev_col.button("Previous", disabled=len(cursors) == 1, on_click=cursors.pop)
+        page_col.write(f"Page {len(cursors)}")
+        next_col.button("Next", disabled=next_cursor is None, on_click=cursors.append, args=[next_cursor])
+
     def users_list(self, users: List[User]):
         st.write("### User List")
-        for i, user in enumerate(users, start=1):
-            col1, col2, col3, col4, col5 = st.columns((0.5, 1, 1, 1, 1))
+        for user in users:
+            col1, col2, col3, col4, col5, col6 = st.columns((0.5, 1, 1, 1, 1, 1))
             active_checkbox = col1.empty()
             col2.write(user.username)
             col3.write(f"{user.first_name} {user.last_name}")
             col4.write("Active" if user.active else "Inactive")
-            open_button = col5.empty()
+            col5.write(", ".join(x.name for x in user.groups))  # eager loaded by `User.get_all`
+            open_button = col6.empty()
 
             active_checkbox.checkbox(
-                label="", value=user.active, key=i, on_change=self.change_user_status, args=[user.username, user.active]
+                label="",
+                value=user.active,
+                key=f"{user.username}_active",
+                on_change=self.change_user_status,
+                args=[user.username, user.active],
+            )
+            open_button.button(
+                "Open", key=f"{user.username}_open_user", on_click=self.open_user_info, args=[user.username]
             )
-            open_button.button("Open", key=f"{i}_open_user", on_click=self.open_user_info, args=[user.username])
 
-    def groups_list(self, groups: List[Group]):
+    def archived_users_list(self, users: List[UserArchive]):
+        st.write("### Archived Users")
+        for user in users:
+            col1, col2, col3, col4 = st.columns((1, 1, 1, 1))
+            col1.write(user.username)
+            col2.write(f"{user.first_name} {user.last_name}")
+            col3.write(f"Archived {user.archived_at:%Y-%m-%d}")
+            col4.button(
+                "Reactivate", key=f"{user.username}_restore_user", on_click=self.user_enable, args=[user.username]
+            )
+
+    def groups_list(self, groups: List[GroupInfo]):
         page_state = st.session_state["page"]
 
         st.write("### Group List")
@@ -179,6 +240,15 @@ class AdminView(DefaultBaseView):
             return users
         st.error("Found no users.")
 
+    def user_add_groups(self, usernames: List[str], groups: List[str]) -> int:
+        return User.add_groups(usernames, groups, self.db)
+
+    def user_delete_groups(self, usernames: List[str], groups: List[str]) -> int:
+        return User.delete_groups(usernames, groups, self.db)
+
+    def user_search(self, term: str, limit: int = 20) -> List[User]:
+        return get_user_search(self.db).search(term, limit)
+
     def user_disable(self, username: str):
         User.set_status(False, username, self.db)
 
@@ -189,12 +259,12 @@ class AdminView(DefaultBaseView):
         if user := User.get(username, self.db):
             if user.groups:
                 self.cookies.set("groups", user.groups)
-                st.session_state["groups"] = user.groups.split(",")
+                self.auth_context.set_groups(user.groups.split(","))
 
     def create_group(self, name):
         return Group.create(name, self.db)
 
-    def group_get_all(self, return_str=True) -> List["Group"]:
+    def group_get_all(self, return_str=True) -> List[GroupInfo]:
         groups = Group.get_all(self.db)
         if return_str and groups:
             return [x.name for x in groups]
@@ -202,6 +272,12 @@ class AdminView(DefaultBaseView):
             return groups
         return None
 
+    def group_inherit(self, name: str, inherits: str) -> bool:
+        return Group.inherit(name, inherits, self.db)
+
+    def group_disinherit(self, name: str, inherits: str) -> bool:
+        return Group.disinherit(name, inherits, self.db)
+
     def group_disable(self, name: str):
         Group.set_status(False, name, self.db)
 
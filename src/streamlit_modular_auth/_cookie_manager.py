@@ -1,10 +1,17 @@
+import base64
+import binascii
+import hashlib
 import os
-import secrets
-from typing import Any
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
 
 import streamlit as st
+from cryptography.fernet import InvalidToken
 from loguru import logger
-from streamlit_cookies_manager import EncryptedCookieManager
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit_cookies_manager.cookie_manager import parse_cookies
+
+from streamlit_modular_auth._keyring import KEY_PARAMS_COOKIE, CookieKeyring, KeyringCookieManager, parse_key_params
 
 
 class CookieManager:
@@ -12,38 +19,219 @@ class CookieManager:
     - Abstracting third-party cookie manager commands behind a local implementation makes custom
       auth cookie interaction possible while also allowing the actual cookie manager used to
       be changed in the future, if required.
+    - Reads are served from the cookies sent with the websocket handshake until the cookie component
+      is needed for a write, so authenticated page loads don't wait on a component round trip.
 
     To Use:
     - If looking to impliment custom auth cookie logic/structure, instead see
       `streamlit_modular_auth.protocols.AuthCookies`.
     - If looking to interact with cookies in other ways, import `streamlit_modular_auth.cookies`
+    - Group several writes (i.e., login/logout) in `with cookies.transaction():` so they are sent to the
+      browser with a single save.
     """
 
-    def __init__(self, cookies: EncryptedCookieManager):
-        self.cookies = cookies
+    TRANSACTION_KEY = "COOKIE_TRANSACTION"
+    DEFERRED_KEY = "COOKIE_DEFERRED"
+    MANAGER_KEY = "COOKIE_MANAGER"
+    HEADERS_KEY = "COOKIE_HEADERS"
+    VALUES_KEY = "COOKIE_VALUES"
+    SYNC_KEY = "CookieManager.sync_cookies"
+    SAVE_KEY = "CookieManager.sync_cookies.save"
+    PACKED_BUDGET = 2048  # raw bytes; stays under the 4KB browser limit after encryption/encoding
+
+    def __init__(self, factory: Callable[[], KeyringCookieManager], keyring: CookieKeyring, prefix: str):
+        self._factory = factory
+        self.keyring = keyring
+        self.prefix = prefix
+
+    @property
+    def cookies(self) -> Optional[KeyringCookieManager]:
+        """Component-backed cookie manager for the current browser session (None until the component has run)"""
+        return st.session_state.get(self.MANAGER_KEY)
+
+    def ready(self) -> bool:
+        return self.cookies is not None and self.cookies.ready()
+
+    @contextmanager
+    def transaction(self) -> Iterator["CookieManager"]:
+        """Collects cookie writes made during the block and flushes them together on exit
+        - Pending writes are held per browser session (in `st.session_state`), since this manager is shared
+        - Reads inside the block see pending writes
+        - Nested transactions join the outer one; writes are discarded if the block raises
+        """
+        if self._pending() is not None:
+            yield self
+            return
+        st.session_state[self.TRANSACTION_KEY] = {}
+        try:
+            yield self
+            self.flush()
+        finally:
+            st.session_state.pop(self.TRANSACTION_KEY, None)
+
+    def flush(self) -> None:
+        """Writes all pending cookie changes, then saves once"""
+        pending = self._pending()
+        if not pending:
+            return
+        logger.info(f"Flushing cookies: {list(pending.keys())}")
+        self._write(dict(pending))
+        pending.clear()
+
+    def sync_deferred(self) -> None:
+        """Saves writes deferred until the cookie component is ready; call once per script run
+        - Logged-in runs may never read or write cookies, so `Login.build_login_ui` and
+          `DefaultBaseView.check_permissions` call this to finish saving the auth cookies set at login
+        """
+        if st.session_state.get(self.DEFERRED_KEY):
+            self._sync()
+
+    def _pending(self) -> Optional[Dict[str, str]]:
+        return st.session_state.get(self.TRANSACTION_KEY)
+
+    def _write(self, values: Dict[str, str]) -> None:
+        """Queues writes for the cookie component; they are deferred until the component is ready"""
+        st.session_state.setdefault(self.DEFERRED_KEY, {}).update(values)
+        if cached := st.session_state.get(self.VALUES_KEY):
+            for name in values:
+                cached.pop(name, None)
+        self._sync()
+
+    def _sync(self) -> bool:
+        """Runs the cookie component (at most once per script run) until the browser has reported its cookies,
+        then applies any deferred writes with a single save
+        """
+        if not self.ready():
+            if self.SYNC_KEY in _keys_this_run():
+                return False
+            st.session_state[self.MANAGER_KEY] = self._factory()
+            if not self.ready():
+                return False
+        if deferred := st.session_state.pop(self.DEFERRED_KEY, None):
+            for name, val in deferred.items():
+                self.cookies[name] = val
+            if self.SAVE_KEY not in _keys_this_run():
+                self.cookies.save()
+        return True
+
+    def _header_cookies(self) -> Optional[Dict[str, str]]:
+        """Encrypted cookies sent with the websocket handshake, read once per browser session"""
+        if self.HEADERS_KEY not in st.session_state:
+            st.session_state[self.HEADERS_KEY] = _read_header_cookies(self.prefix)
+        return st.session_state[self.HEADERS_KEY]
+
+    def _read(self, name: str) -> Any:
+        if not self.ready() and (headers := self._header_cookies()) is not None:
+            return self._decrypt_cached(name, headers.get(name), lambda raw: self._decrypt_header(headers, raw))
+        if not self._sync():
+            # No handshake headers to read from; wait on the component instead
+            st.stop()
+        return self._decrypt_cached(name, self.cookies.raw(name), self.cookies.decrypt)
+
+    def _decrypt_cached(self, name: str, raw: Optional[str], decrypt: Callable[[str], Optional[str]]) -> Any:
+        """Decrypts a cookie value once per browser session
+        - Cached values are keyed by a digest of the ciphertext, so a changed cookie is decrypted again
+        """
+        if not raw:
+            return None
+        digest = hashlib.blake2b(raw.encode("utf-8"), digest_size=16).digest()
+        cached = st.session_state.setdefault(self.VALUES_KEY, {})
+        if (hit := cached.get(name)) and hit[0] == digest:
+            return hit[1]
+        value = decrypt(raw)
+        cached[name] = (digest, value)
+        return value
+
+    def _decrypt_header(self, headers: Dict[str, str], raw: str) -> Optional[str]:
+        if not (key_params := parse_key_params(headers.get(KEY_PARAMS_COOKIE))):
+            return None
+        try:
+            return self.keyring.fernet(*key_params).decrypt(raw.encode("utf-8")).decode("utf-8")
+        except InvalidToken:
+            return None
 
     def get(self, name) -> Any:
-        value = self.cookies.get(name)
+        if st.session_state.get(self.DEFERRED_KEY):
+            self._sync()
+        for queued in (self._pending(), st.session_state.get(self.DEFERRED_KEY)):
+            if queued and name in queued:
+                value = queued[name]
+                break
+        else:
+            value = self._read(name)
         logger.info(f"Getting cookie: {name}; value: {value}")
         return value
 
     def set(self, name, val) -> None:
         logger.info(f"Setting cookie: {name}; value: {val}")
-        self.cookies[name] = val
-        # self.cookies.save()
+        pending = self._pending()
+        if pending is not None:
+            pending[name] = val
+            return
+        self._write({name: val})
 
     def expire(self, name: str, val: Any = None) -> None:
         if not val:
             val = ""
-        self.cookies[name] = val
+        self.set(name, val)
+
+    def set_packed(self, name: str, payload: bytes) -> None:
+        """Stores a binary payload as a single cookie
+        - Raises `ValueError` if the payload exceeds `PACKED_BUDGET`
+        """
+        if len(payload) > self.PACKED_BUDGET:
+            raise ValueError(f"Packed cookie '{name}' is {len(payload)} bytes; budget is {self.PACKED_BUDGET}")
+        self.set(name, base64.urlsafe_b64encode(payload).decode("ascii"))
+
+    def get_packed(self, name: str) -> Optional[bytes]:
+        """Returns a payload stored with `set_packed`, or None if missing/expired/unreadable"""
+        if not (value := self.get(name)):
+            return None
+        try:
+            return base64.urlsafe_b64decode(value.encode("ascii"))
+        except (binascii.Error, ValueError):
+            return None
 
     def keys(self):
-        return self.cookies.keys()
+        if self.ready():
+            keys = set(self.cookies.keys())
+        elif (headers := self._header_cookies()) is not None:
+            keys = set(headers.keys())
+        else:
+            if not self._sync():
+                st.stop()
+            keys = set(self.cookies.keys())
+        for queued in (self._pending(), st.session_state.get(self.DEFERRED_KEY)):
+            if queued:
+                keys |= queued.keys()
+        return keys
+
+
+def _keys_this_run() -> set:
+    """User keys of widgets/components already rendered in the current script run"""
+    ctx = get_script_run_ctx()
+    return ctx.widget_user_keys_this_run if ctx else set()
+
+
+def _read_header_cookies(prefix: str) -> Optional[Dict[str, str]]:
+    """Parses this app's cookies from the websocket handshake headers
+    - Returns None when headers aren't available (older Streamlit, or not running in a browser session)
+    """
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+    except ImportError:
+        return None
+    try:
+        headers = _get_websocket_headers()
+        if headers is None:
+            return None
+        raw_cookies = parse_cookies(headers.get("Cookie") or "")
+    except (RuntimeError, ValueError):
+        return None
+    return {k[len(prefix) :]: v for k, v in raw_cookies.items() if k.startswith(prefix)}
 
 
 def _initialize_cookie_manager() -> CookieManager:
     prefix = os.environ.get("ALT_AUTH_COOKIE_PREFIX") or "auth_cookies"  # Makes robot_tests easier
-    cookies = EncryptedCookieManager(prefix=prefix, password=secrets.token_urlsafe(48))
-    if not cookies.ready():
-        st.stop()
-    return CookieManager(cookies)
+    keyring = CookieKeyring.load()
+    return CookieManager(lambda: KeyringCookieManager(prefix=prefix, keyring=keyring), keyring, prefix)
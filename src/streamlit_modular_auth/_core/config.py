@@ -1,15 +1,21 @@
 from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List
 
 import streamlit as st
 from sqlalchemy.engine import Engine
 
 from streamlit_modular_auth._cookie_manager import CookieManager, _initialize_cookie_manager
+from streamlit_modular_auth._core.pages import PageRegistry
 from streamlit_modular_auth.handlers.auth_cookies import DefaultAuthCookies
 from streamlit_modular_auth.handlers.forgot_password_msg import DefaultForgotPasswordMsg
 from streamlit_modular_auth.handlers.storage import DefaultJSONUserAuth, DefaultJSONUserStorage
-from streamlit_modular_auth.protocols import AuthCookies, ForgotPasswordMessage, UserAuth, UserStorage
+from streamlit_modular_auth.protocols import AuthCookies, ForgotPasswordMessage, GroupProvider, UserAuth, UserStorage
+
+if TYPE_CHECKING:
+    from streamlit_modular_auth._apps.admin.db import EngineRouter
 
 cookies = _initialize_cookie_manager()
+pages = PageRegistry()
 
 
 @dataclass
@@ -32,9 +38,22 @@ class ModularAuth:
         plugin_user_storage (UserStorage): Protocol to add custom user storage functionality
         plugin_forgot_password_msg (ForgotPasswordMessage): Protocol to add custom forgot password messaging
         plugin_auth_cookies (AuthCookies): Protocol to add custom authentication cookies functionality
+        plugin_group_provider (GroupProvider, Optional): Protocol to load user groups from storage on demand
+        db_url (str, Optional): Database url used by `set_database_storage` when no `db_engine` is provided
+        db_pool_size (int): Connections kept open in the pool (non-SQLite `db_url` only)
+        db_max_overflow (int): Connections allowed beyond `db_pool_size` under load (non-SQLite `db_url` only)
+        db_pool_timeout (int): Seconds to wait for a pooled connection before raising (non-SQLite `db_url` only)
+        db_query_cache_size (int): Compiled SQL statements cached per engine built from `db_url`
+        db_read_engines (List[Engine]): Read replicas; with any, `set_database_storage` routes reads to them
+            (round-robin, unhealthy replicas skipped) and writes to `db_engine`
+        db_read_pin_secs (float): After a write, that browser session reads from `db_engine` for this long
+        db_archive_inactive_days (int, Optional): Move users inactive this long to `streamlit_users_archive` (a
+            background job, every `db_archive_interval_secs`); reactivating one in the admin tools restores them
+        db_archive_interval_secs (float): Seconds between archive job runs
     """
 
     cookies: CookieManager = cookies
+    pages: PageRegistry = pages
     state = st.session_state
     login_expire: int = 7200
     login_width: int = 200
@@ -51,25 +70,64 @@ class ModularAuth:
     plugin_user_storage: UserStorage = DefaultJSONUserStorage()
     plugin_forgot_password_msg: ForgotPasswordMessage = DefaultForgotPasswordMsg()
     plugin_auth_cookies: AuthCookies = DefaultAuthCookies()
+    plugin_group_provider: GroupProvider = None
     db_engine: Engine = None
+    db_url: str = None
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: int = 30
+    db_query_cache_size: int = 500
+    db_read_engines: List[Engine] = field(default_factory=list)
+    db_read_pin_secs: float = 5.0
+    db_router: "EngineRouter" = None
+    db_archive_inactive_days: int = None
+    db_archive_interval_secs: float = 3600.0
     config: dict = field(default_factory=lambda: {})
 
-    def set_database_storage(self, use_admin=False):
+    def set_database_storage(self, use_admin=False, use_group_provider=False, read_engines: List[Engine] = None):
+        from streamlit_modular_auth._apps.admin.archive import start_archiver
+        from streamlit_modular_auth._apps.admin.db import EngineRouter
         from streamlit_modular_auth._apps.admin.page import admin_page
-        from streamlit_modular_auth._apps.admin.storage import DefaultDBUserAuth, DefaultDBUserStorage
+        from streamlit_modular_auth._apps.admin.storage import (
+            DefaultDBGroupProvider,
+            DefaultDBUserAuth,
+            DefaultDBUserStorage,
+        )
 
         if not self.db_engine:
             from sqlalchemy import create_engine
 
             SQLITE_DEFAULT_URL = "sqlite:///sqlmodel_storage.sqlite"
-            self.db_engine = create_engine(SQLITE_DEFAULT_URL, pool_pre_ping=True)
+            db_url = self.db_url or SQLITE_DEFAULT_URL
+            if db_url.startswith("sqlite"):
+                self.db_engine = create_engine(db_url, pool_pre_ping=True, query_cache_size=self.db_query_cache_size)
+            else:
+                self.db_engine = create_engine(
+                    db_url,
+                    pool_pre_ping=True,
+                    pool_size=self.db_pool_size,
+                    max_overflow=self.db_max_overflow,
+                    pool_timeout=self.db_pool_timeout,
+                    query_cache_size=self.db_query_cache_size,
+                )
 
         print(f"SQLALCHEMY ENGINE: {self.db_engine}")
 
+        if read_engines:
+            self.db_read_engines = list(read_engines)
+        if self.db_read_engines:
+            self.db_router = EngineRouter(self.db_engine, self.db_read_engines, pin_secs=self.db_read_pin_secs)
+        db = self.db_router or self.db_engine
+
         self.plugin_user_storage = DefaultDBUserStorage()
-        self.plugin_user_storage.db = self.db_engine
+        self.plugin_user_storage.db = db
         self.plugin_user_auth = DefaultDBUserAuth()
-        self.plugin_user_auth.db = self.db_engine
+        self.plugin_user_auth.db = db
+        if use_group_provider:
+            self.plugin_group_provider = DefaultDBGroupProvider()
+            self.plugin_group_provider.db = db
+        if self.db_archive_inactive_days:
+            start_archiver(db, self.db_archive_inactive_days, interval_secs=self.db_archive_interval_secs)
 
         if use_admin:
             self.admin_page = admin_page
@@ -0,0 +1,117 @@
+import time
+from typing import Any, Dict, FrozenSet, Iterable, Optional
+
+from streamlit.runtime.state import SessionStateProxy
+
+
+class AuthContext:
+    """Authentication state for one browser session, kept as a single `st.session_state` entry
+    - Shared by `Login`, `DefaultBaseView` and `AdminView` (see their `auth` property)
+    - `groups` is None until loaded (from login, auth cookies, or storage); an empty set means "no groups"
+    - `session_groups` are granted to this session only (see `DefaultBaseView.add_session_groups`); they are kept
+      in `groups` when groups are reloaded from storage
+    - `st.session_state["LOGGED_IN"]` mirrors `logged_in`, for apps written against the original README
+    - Plugins set the session's user with `st.session_state["modular_auth.username"]`, `["modular_auth.groups"]` or
+      `["modular_auth.group_mask"]`; those keys are moved into the context the next time it is loaded
+    - Deprecated: the un-namespaced `["username"]`/`["groups"]`/`["group_mask"]` keys are still read when their value
+      changes, but left in place, since they may belong to the host app
+    """
+
+    __slots__ = (
+        "user_id",
+        "username",
+        "groups",
+        "session_groups",
+        "group_mask",
+        "expires",
+        "validated_at",
+        "_logged_in",
+        "logout_hit",
+        "groups_version",
+        "decisions",
+        "_state",
+        "_adopted",
+    )
+
+    KEY = "AUTH_CONTEXT"
+    LOGGED_IN_KEY = "LOGGED_IN"
+    PLUGIN_KEYS = {
+        "username": "modular_auth.username",
+        "groups": "modular_auth.groups",
+        "group_mask": "modular_auth.group_mask",
+    }
+
+    def __init__(self, state: SessionStateProxy = None):
+        self._state = state
+        self._adopted: Dict[str, Any] = {}  # last value read from each un-namespaced key
+        self.clear()
+
+    @classmethod
+    def load(cls, state: SessionStateProxy) -> "AuthContext":
+        context = state.get(cls.KEY)
+        if context is None:
+            context = state[cls.KEY] = cls(state)
+        context.adopt(state)
+        return context
+
+    @property
+    def logged_in(self) -> bool:
+        return self._logged_in
+
+    @logged_in.setter
+    def logged_in(self, value: bool) -> None:
+        self._logged_in = value
+        if self._state is not None:
+            self._state[self.LOGGED_IN_KEY] = value
+
+    def adopt(self, state: SessionStateProxy) -> None:
+        """Moves plugin-set session state keys into the context (see the class docstring)"""
+        for name, key in self.PLUGIN_KEYS.items():
+            if key in state:
+                self._set(name, state.pop(key))
+            elif name in state and self._adopted.get(name) is not (value := state[name]):
+                self._adopted[name] = value
+                self._set(name, value)
+
+    def _set(self, name: str, value: Any) -> None:
+        if name == "groups":
+            self.set_groups(value)
+        elif name == "group_mask":
+            self.group_mask = value or 0
+            self.decisions = {}  # `groups` stays as is: None still means "not loaded"
+        else:
+            self.username = value
+
+    def set_groups(self, groups: Optional[Iterable[str]], group_mask: int = None) -> None:
+        self.groups = frozenset(groups or ())
+        if group_mask is not None:
+            self.group_mask = group_mask
+        self.decisions = {}
+
+    def login(self, username: str = None, expires: float = None) -> None:
+        """Marks the session as authenticated (credentials or auth cookies were just validated)"""
+        self.username = username or self.username
+        self.expires = expires or self.expires
+        self.validated_at = time.time()
+        self.logged_in = True
+        self.logout_hit = False
+
+    def expired(self) -> bool:
+        return self.expires is not None and time.time() > self.expires
+
+    def clear(self) -> None:
+        self.user_id: Optional[int] = None
+        self.username: Optional[str] = None
+        self.groups: Optional[FrozenSet[str]] = None
+        self.session_groups: FrozenSet[str] = frozenset()
+        self.group_mask: int = 0
+        self.expires: Optional[float] = None
+        self.validated_at: Optional[float] = None
+        self.logged_in: bool = False
+        self.logout_hit: bool = False
+        self.groups_version: Optional[int] = None
+        self.decisions: Dict[tuple, bool] = {}
+
+    def __repr__(self) -> str:
+        groups = sorted(self.groups) if self.groups is not None else None
+        return f"AuthContext(username={self.username!r}, logged_in={self.logged_in}, groups={groups})"
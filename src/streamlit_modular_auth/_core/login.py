@@ -18,6 +18,7 @@ from streamlit_modular_auth.protocol_validation.auth_cookies import validate_aut
 from streamlit_modular_auth.protocol_validation.storage import validate_user_storage
 
 from .config import ModularAuth
+from .context import AuthContext
 
 
 class Login:
@@ -57,36 +58,51 @@ class Login:
             st.error("`enable_admin_page()` requires `set_database_storage`")
             st.stop()
 
+    @property
+    def auth_context(self) -> AuthContext:
+        """Authentication state for the current browser session"""
+        return AuthContext.load(self.state)
+
     def __login_widget(self) -> None:
         """
         Creates the login widget, checks and sets cookies, authenticates the users.
         """
-        if st.session_state["LOGGED_IN"] is True:
+        auth = self.auth_context
+        if auth.logged_in:
             return
 
         if self.auth_cookies.check(self.cookies):
-            st.session_state["LOGGED_IN"] = True
+            auth.adopt(self.state)
+            auth.login()
             return
 
-        st.session_state["LOGOUT_BUTTON_HIT"] = False
-        del_login = st.empty()
-        with del_login.form("Login Form"):
-            username = st.text_input("Username", placeholder="Your unique username")
-            password = st.text_input("Password", placeholder="Your password", type="password")
+        auth.logout_hit = False
+        with st.form("Login Form"):
+            st.text_input("Username", placeholder="Your unique username", key="LOGIN_USERNAME")
+            st.text_input("Password", placeholder="Your password", type="password", key="LOGIN_PASSWORD")
             st.markdown("###")
-            login_submit_button = st.form_submit_button(label="Login")
+            st.form_submit_button(label="Login", on_click=self.__login_submit)
 
-        if login_submit_button is True:
-            if self.auth.check_credentials(username, password) is not True:
-                st.error("Invalid Username or Password!")
-            else:
-                self.auth_cookies.set(username, self.cookies, self.expire_delay)
-                if st.session_state.get("groups"):
-                    groups = st.session_state["groups"]
-                    self.cookies.set("groups", ",".join(groups))
-                st.session_state["LOGGED_IN"] = True
-                del_login.empty()
-                st.experimental_rerun()
+        if st.session_state.pop("LOGIN_FAILED", False):
+            st.error("Invalid Username or Password!")
+
+    def __login_submit(self) -> None:
+        """
+        Login form callback; runs before the script, so a successful login renders logged in without a rerun.
+        """
+        username = st.session_state.get("LOGIN_USERNAME", "")
+        password = st.session_state.get("LOGIN_PASSWORD", "")
+        if self.auth.check_credentials(username, password) is not True:
+            st.session_state["LOGIN_FAILED"] = True
+            return
+        auth = self.auth_context
+        auth.adopt(self.state)
+        with self.cookies.transaction():
+            self.auth_cookies.set(username, self.cookies, self.expire_delay)
+            stores_groups = getattr(self.auth_cookies, "stores_groups", False)
+            if auth.groups and not stores_groups:
+                self.cookies.set("groups", ",".join(auth.groups))
+        auth.login(username)
 
     def __animation(self) -> None:
         """
@@ -183,17 +199,18 @@ class Login:
         """
         Creates the logout widget in the sidebar only if the user is logged in.
         """
-        if st.session_state["LOGGED_IN"] is True:
-            del_logout = st.sidebar.empty()
-            del_logout.markdown("#")
-            logout_click_check = del_logout.button(self.logout_button_name)
-
-            if logout_click_check is True:
-                st.session_state["LOGOUT_BUTTON_HIT"] = True
-                self.auth_cookies.expire(self.cookies)
-                st.session_state["LOGGED_IN"] = False
-                del_logout.empty()
-                st.experimental_rerun()
+        if self.auth_context.logged_in:
+            st.sidebar.button(self.logout_button_name, on_click=self.__logout)
+
+    def __logout(self) -> None:
+        """
+        Logout button callback; runs before the script, so the next render is already logged out.
+        """
+        with self.cookies.transaction():
+            self.auth_cookies.expire(self.cookies)
+        auth = self.auth_context
+        auth.clear()
+        auth.logout_hit = True
 
     def __nav_sidebar(self):
         """
@@ -264,12 +281,7 @@ class Login:
         """
         Brings everything together, calls important functions.
         """
-        if "LOGGED_IN" not in st.session_state:
-            st.session_state["LOGGED_IN"] = False
-
-        if "LOGOUT_BUTTON_HIT" not in st.session_state:
-            st.session_state["LOGOUT_BUTTON_HIT"] = False
-
+        self.cookies.sync_deferred()
         main_page_sidebar, selected_option = self.__nav_sidebar()
 
         if selected_option == self.login_label:
@@ -277,7 +289,7 @@ class Login:
             with c1:
                 self.__login_widget()
             with c2:
-                if st.session_state["LOGGED_IN"] is False:
+                if not self.auth_context.logged_in:
                     self.__animation()
 
         if not self.hide_registration or not self.hide_account_management:
@@ -294,7 +306,7 @@ class Login:
 
         self.__logout_widget()
 
-        if st.session_state["LOGGED_IN"] is True:
+        if self.auth_context.logged_in:
             main_page_sidebar.empty()
 
         if self.hide_menu_bool is True:
@@ -303,7 +315,7 @@ class Login:
         if self.hide_footer_bool is True:
             self.__hide_footer()
 
-        return st.session_state["LOGGED_IN"]
+        return self.auth_context.logged_in
 
 
 # Author: Gauri Prabhakar
@@ -0,0 +1,48 @@
+from typing import Optional
+
+from loguru import logger
+from streamlit.runtime.state import SessionStateProxy
+
+
+class PageState:
+    """Current page for a browser session, updated in place (no rerun needed)
+    - `state["page"]` is reset to `{"name": ...}` when a different page loads, so page-specific keys don't leak
+    - Script runs are counted per navigation (`runs`/`reruns`); the count for the page being left is logged, which
+      makes rerun regressions visible in benchmarks
+    - `enter` is expected once per script run (see `DefaultBaseView.check_state`)
+    """
+
+    PAGE_KEY = "page"
+    RUNS_KEY = "PAGE_RUNS"
+
+    def __init__(self, state: SessionStateProxy):
+        self.state = state
+
+    @property
+    def name(self) -> Optional[str]:
+        page = self.state.get(self.PAGE_KEY)
+        return page.get("name") if page else None
+
+    @property
+    def runs(self) -> int:
+        """Script runs since the current page was navigated to (including the first)"""
+        return self.state.get(self.RUNS_KEY, 0)
+
+    @property
+    def reruns(self) -> int:
+        return max(self.runs - 1, 0)
+
+    def enter(self, name: str) -> bool:
+        """Records a script run for page `name`
+
+        Returns:
+            bool: True if this run navigated to a different page
+        """
+        if self.name == name:
+            self.state[self.RUNS_KEY] = self.runs + 1
+            return False
+        if self.name is not None:
+            logger.info(f"Page '{self.name}' left after {self.runs} run(s)")
+        self.state[self.PAGE_KEY] = {"name": name}
+        self.state[self.RUNS_KEY] = 1
+        return True
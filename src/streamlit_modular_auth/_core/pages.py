@@ -0,0 +1,78 @@
+import threading
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import streamlit as st
+from loguru import logger
+
+
+class Page(NamedTuple):
+    url_path: str  # relative to the app root; "" for the main page
+    script_path: str
+
+
+class PageRegistry:
+    """Page name -> page location for a multipage app
+    - Built once per process from the app's `pages/` directory (the same source Streamlit uses for its sidebar)
+    - Names are matched case-insensitively against the page name Streamlit shows (i.e., "1_Pictures.py" ->
+      "pictures"), so a view's `name` finds its page without extra configuration
+    - "" (and the main script's page name) resolve to the main page
+    """
+
+    def __init__(self):
+        self._pages: Optional[Dict[str, Page]] = None
+        self._lock = threading.Lock()
+
+    def build(self, main_script_path: str = None) -> Dict[str, Page]:
+        from streamlit import source_util
+
+        main_script_path = main_script_path or _main_script_path()
+        pages: Dict[str, Page] = {}
+        if main_script_path:
+            main_dir = Path(main_script_path).resolve().parent
+            for i, page in enumerate(source_util.get_pages(main_script_path).values()):
+                url_path = "" if i == 0 else page["page_name"]
+                script_path = str(Path(page["script_path"]).relative_to(main_dir))
+                pages[page["page_name"].lower()] = Page(url_path, script_path)
+            if pages:
+                pages[""] = next(iter(pages.values()))
+        logger.info(f"Page registry built: {list(pages.keys())}")
+        self._pages = pages
+        return pages
+
+    def register(self, name: str, url_path: str, script_path: str = None) -> None:
+        """Adds/overrides a page, i.e. when a view's `name` doesn't match its page file"""
+        self.pages[name.lower()] = Page(url_path, script_path or url_path)
+
+    @property
+    def pages(self) -> Dict[str, Page]:
+        if self._pages is None:
+            with self._lock:
+                if self._pages is None:
+                    self.build()
+        return self._pages
+
+    def get(self, name: str) -> Optional[Page]:
+        return self.pages.get(name.lower())
+
+    def redirect(self, name: str) -> None:
+        """Sends the browser to a page and ends the current script run
+        - Uses `st.switch_page` where available; otherwise a meta refresh, which needs no script polling
+        """
+        page = self.get(name)
+        if page is None:
+            logger.warning(f"No page registered for '{name}'; redirecting to main page")
+            page = self.get("") or Page("", "")
+        if hasattr(st, "switch_page"):
+            st.switch_page(page.script_path)
+        st.markdown(f'<meta http-equiv="refresh" content="0; url=\'./{page.url_path}\'">', unsafe_allow_html=True)
+        st.stop()
+
+
+def _main_script_path() -> Optional[str]:
+    try:
+        from streamlit.runtime import Runtime
+
+        return Runtime.instance()._main_script_path
+    except (ImportError, RuntimeError, AttributeError):
+        return None
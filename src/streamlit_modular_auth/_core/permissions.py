@@ -0,0 +1,42 @@
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+ADMIN_GROUP = "admin"
+
+
+def _compile_groups(groups: Optional[Iterable[str]]) -> FrozenSet[str]:
+    """Groups that grant access to a page/section; admin is always included when any group is required"""
+    if not groups:
+        return frozenset()
+    return frozenset(groups) | {ADMIN_GROUP}
+
+
+def mask_from_ids(group_ids: Iterable[int]) -> int:
+    """Permission bitset where each group's bit position is its `streamlit_groups` id"""
+    mask = 0
+    for group_id in group_ids:
+        mask |= 1 << group_id
+    return mask
+
+
+def mask_to_bytes(mask: int) -> bytes:
+    return mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+
+
+def mask_from_bytes(data: bytes) -> int:
+    return int.from_bytes(data, "little")
+
+
+class GroupBits:
+    """Catalog of group name -> bit position (the group's table id)
+    - Ids are stable, so masks stored in sessions/cookies stay valid as groups are added
+    """
+
+    def __init__(self, ids: Dict[str, int]):
+        self.ids = ids
+
+    def mask(self, names: Iterable[str]) -> int:
+        """Mask for the given group names; names with no group record grant nothing"""
+        return mask_from_ids(self.ids[x] for x in names if x in self.ids)
+
+    def names(self, mask: int) -> List[str]:
+        return [name for name, group_id in self.ids.items() if mask >> group_id & 1]
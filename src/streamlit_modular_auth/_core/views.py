@@ -1,26 +1,37 @@
-import time
-from typing import List
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 
 import streamlit as st
-from streamlit.components.v1 import html
 
 from streamlit_modular_auth._cookie_manager import CookieManager
 
 from .config import ModularAuth
+from .context import AuthContext
+from .page_state import PageState
+from .pages import PageRegistry
+from .permissions import GroupBits, _compile_groups
 
 
 class DefaultBaseView:
     title: str
     name: str
     groups: List[str] = None
+    _required_groups: FrozenSet[str] = frozenset()
+    _required_mask: Tuple[Optional[GroupBits], int] = (None, 0)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._required_groups = _compile_groups(cls.groups)
 
     def __init__(self, app: ModularAuth = None):
         if not app:
             app = ModularAuth()
         self.cookies: CookieManager = app.cookies
+        self.pages: PageRegistry = app.pages
+        self.page_state = PageState(app.state)
         self.state = app.state
         self.auth_cookies = app.plugin_auth_cookies
-        self.db = app.db_engine
+        self.group_provider = app.plugin_group_provider
+        self.db = app.db_router or app.db_engine  # routed reads/writes when read replicas are configured
 
     def check_permissions(self) -> bool:
         """Checks if user is (1) logged in, and (2) has permission for the page/section in question
@@ -28,31 +39,27 @@ class DefaultBaseView:
         Returns:
             bool: authorization status
         """
+        self.cookies.sync_deferred()
         if not self.check_existing_session():
             st.warning("Not logged in...")
-            with st.spinner("Redirecting..."):
-                time.sleep(1)
-                self.change_page("")
+            self.change_page("")
         if hasattr(self, "groups"):
             return self.check_group_access(self.groups)
         else:
             return True
 
     def check_state(self):
-        """Helper method that resets "page" value if a different page is loaded"""
-        if self.state.get("page") and self.state["page"].get("name") == self.name:
-            return
-        if self.state.get("page"):
-            self.state.pop("page")
-        self.state["page"] = {"name": self.name}
-        st.experimental_rerun()
+        """Helper method that resets "page" value if a different page is loaded
+        - State is updated in place for the current run; call once per run (it also counts runs per navigation)
+        """
+        self.page_state.enter(self.name)
 
-    def change_page(self, page_name, timeout_secs=3):
+    def change_page(self, page_name: str, timeout_secs: int = None):
         """Changes Streamlit pages in Multi-Page App
-        - Found here: https://github.com/streamlit/streamlit/issues/4832#issuecomment-1201938174
-        - Should be **REPLACED** when Streamlit releases native way to accomplish this
+        - Looks the page up in the page registry (`ModularAuth.pages`) and redirects; the current script run ends
+        - `timeout_secs` is no longer used (kept for compatibility)
 
-        Example usage (from issue post):
+        Example usage:
         ```
         if st.button("< Prev"):
             change_page("Foo")
@@ -60,32 +67,12 @@ class DefaultBaseView:
             change_page("Bar")
         ```
         """
-        nav_script = """
-        <script type="text/javascript">
-            function attempt_nav_page(page_name, start_time, timeout_secs) {
-                var links = window.parent.document.getElementsByTagName("a");
-                for (var i = 0; i < links.length; i++) {
-                    if (links[i].href.toLowerCase().endsWith("/" + page_name.toLowerCase())) {
-                        links[i].click();
-                        return;
-                    }
-                }
-                var elasped = new Date() - start_time;
-                if (elasped < timeout_secs * 1000) {
-                    setTimeout(attempt_nav_page, 100, page_name, start_time, timeout_secs);
-                } else {
-                    alert("Unable to navigate to page '" + page_name + "' after " + timeout_secs + " second(s).");
-                }
-            }
-            window.addEventListener("load", function() {
-                attempt_nav_page("%s", new Date(), %d);
-            });
-        </script>
-        """ % (
-            page_name,
-            timeout_secs,
-        )
-        html(nav_script)
+        self.pages.redirect(page_name)
+
+    @property
+    def auth_context(self) -> AuthContext:
+        """Authentication state for the current browser session"""
+        return AuthContext.load(self.state)
 
     def check_existing_session(self) -> bool:
         """Checks whether or not user is logged in
@@ -93,15 +80,19 @@ class DefaultBaseView:
         Returns:
             bool: logged in status
         """
-        if self.state.get("LOGGED_IN") is True:
+        auth = self.auth_context
+        if auth.logged_in and not auth.expired():
             return True
         if self.auth_cookies.check(self.cookies) is True:
-            self.state["LOGGED_IN"] = True
+            auth.adopt(self.state)
+            auth.login()
             return True
+        auth.logged_in = False
         return False
 
-    def check_group_access(self, groups: list) -> bool:
+    def check_group_access(self, groups: Iterable[str] = None) -> bool:
         """Checks if user has access to required groups
+        - The view's own `groups` are compiled once, when the class is defined
 
         Args:
             groups (list): Permissions groups required for section/page (set in the class that inherits PageView)
@@ -109,18 +100,81 @@ class DefaultBaseView:
         Returns:
             bool: page/section authorization status
         """
-        if not groups:
-            return True
-        if "groups" not in self.state.keys():
-            user_groups = self.cookies.get("groups")
-            if user_groups:
-                self.state["groups"] = user_groups.split(",")
+        if groups is None or groups is type(self).groups:
+            required = self._required_groups
         else:
-            user_groups = self.state["groups"]
-        if not user_groups:
+            required = _compile_groups(groups)
+        if not required:
+            return True
+        auth = self.auth_context
+        if self.group_provider and auth.username:
+            return not required.isdisjoint(self.group_provider.get_groups(auth.username))
+        decisions = self._decisions(auth)
+        key = (auth.username, required)
+        if (allowed := decisions.get(key)) is None:
+            allowed = decisions[key] = self._check_groups(auth, required)
+        return allowed
+
+    def add_session_groups(self, *groups: str) -> None:
+        """Grants groups to the current session only (not saved to storage), and drops cached decisions"""
+        auth = self.auth_context
+        auth.session_groups |= set(groups)
+        auth.set_groups((auth.groups or frozenset()) | auth.session_groups)
+
+    def _decisions(self, auth: AuthContext) -> Dict[tuple, bool]:
+        """Per-session (user, required groups) -> allowed cache
+        - When an admin changes groups the version counter (stored in the database, so shared by every process and
+          replica) moves; the user's groups are then reloaded from storage (keeping `add_session_groups` grants) and
+          cached decisions are dropped
+        """
+        version = self._groups_version()
+        if auth.groups_version != version:
+            self._reload_groups(auth)
+            auth.groups_version = version
+            auth.decisions = {}
+        return auth.decisions
+
+    def _groups_version(self) -> int:
+        if not self.db:
+            return 0
+        from streamlit_modular_auth._apps.admin.models import Group
+
+        return Group.get_version(self.db)
+
+    def _reload_groups(self, auth: AuthContext) -> None:
+        if not self.db or not auth.username:
+            return
+        from streamlit_modular_auth._apps.admin.models import User
+
+        groups, group_mask = User.get_effective_permissions(auth.username, self.db)
+        auth.set_groups(set(groups) | auth.session_groups, group_mask=group_mask)
+
+    def _check_groups(self, auth: AuthContext, required: FrozenSet[str]) -> bool:
+        if auth.group_mask and (bits := self._group_bits()) and auth.group_mask & self._mask(bits, required):
+            return True
+        if auth.groups is None and (cookie_groups := self.cookies.get("groups")):
+            auth.groups = frozenset(cookie_groups.split(","))
+        if not auth.groups:
             return False
-        groups.append("admin")
-        return any(True for x in groups if x in user_groups)
+        return not required.isdisjoint(auth.groups)
+
+    def _group_bits(self) -> Optional[GroupBits]:
+        """Group name -> bit catalog; only available when groups are stored in the database"""
+        if not self.db:
+            return None
+        from streamlit_modular_auth._apps.admin.models import Group
+
+        return Group.get_bits(self.db)
+
+    def _mask(self, bits: GroupBits, required: FrozenSet[str]) -> int:
+        """Required-groups mask; the view's own mask is computed once per group catalog"""
+        if required is not self._required_groups:
+            return bits.mask(required)
+        cached_bits, mask = self._required_mask
+        if cached_bits is not bits:
+            mask = bits.mask(required)
+            type(self)._required_mask = (bits, mask)
+        return mask
 
     # def setup(self, config: Config):
     #     self.cookies = config.cookies
@@ -0,0 +1,244 @@
+import base64
+import binascii
+import json
+import os
+import secrets
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from loguru import logger
+from streamlit_cookies_manager import EncryptedCookieManager
+
+DEFAULT_KEYRING_FILE = ".auth_cookie_keyring.json"
+KEY_PARAMS_COOKIE = "EncryptedCookieManager.key_params"
+
+
+def parse_key_params(raw_key_params: Optional[str]) -> Optional[Tuple[bytes, int]]:
+    """Parses the (unencrypted) salt/iterations cookie written by EncryptedCookieManager"""
+    if not raw_key_params:
+        return None
+    try:
+        raw_salt, raw_iterations, _ = raw_key_params.split(":")
+        return base64.b64decode(raw_salt), int(raw_iterations)
+    except (ValueError, TypeError, binascii.Error):
+        return None
+
+
+# Derived keys kept: one per browser (each has its own salt) and keyring key in use; a miss re-runs PBKDF2 (~100ms)
+KEY_CACHE_SIZE = int(os.environ.get("MODULAR_AUTH_COOKIE_KEY_CACHE_SIZE") or 16384)
+
+
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def _derive_fernet(salt: bytes, iterations: int, password: str) -> Fernet:
+    """Same key derivation as EncryptedCookieManager (PBKDF2, slow by design); the most recently used keys are kept
+    (`KEY_CACHE_SIZE`, set with `MODULAR_AUTH_COOKIE_KEY_CACHE_SIZE`)"""
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=iterations)
+    return Fernet(base64.urlsafe_b64encode(kdf.derive(password.encode("utf-8"))))
+
+
+@contextmanager
+def _file_lock(path: Path) -> Iterator[None]:
+    """Exclusive lock (a `.lock` file next to `path`) shared by every process using the keyring file"""
+    fd = os.open(path.with_suffix(".lock"), os.O_CREAT | os.O_RDWR, 0o600)
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        if os.name == "nt":
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)
+
+
+class KeyringFernet:
+    """Fernet for one browser's salt that follows the keyring's current keys
+    - Encrypts with the primary key; decrypts with the primary, then each retired key
+    - Keys are derived on first use, so a browser on the primary key never pays for the retired ones
+    """
+
+    def __init__(self, keyring: "CookieKeyring", salt: bytes, iterations: int):
+        self.keyring = keyring
+        self.salt = salt
+        self.iterations = iterations
+
+    def encrypt(self, value: bytes) -> bytes:
+        self.keyring.refresh()
+        return _derive_fernet(self.salt, self.iterations, self.keyring.primary).encrypt(value)
+
+    def decrypt(self, token: bytes) -> bytes:
+        self.keyring.refresh()
+        for key in self.keyring.keys:
+            try:
+                return _derive_fernet(self.salt, self.iterations, key).decrypt(token)
+            except InvalidToken:
+                continue
+        raise InvalidToken
+
+
+class CookieKeyring:
+    """Persistent set of passwords used to encrypt auth cookies
+    - The primary key encrypts all new cookies; decryption tries the primary key, then each retired key
+    - Keys survive restarts and can be shared by replicas, so existing sessions stay valid across deploys
+
+    Loading order (see `CookieKeyring.load`):
+    - `MODULAR_AUTH_COOKIE_KEYS` environment variable: comma separated, primary first. Rotation is then
+      managed by whoever sets the variable.
+    - Keyring file (`MODULAR_AUTH_COOKIE_KEYRING`, defaults to `.auth_cookie_keyring.json`), created if missing,
+      and rotated in place once the primary key is older than `rotate_after_days`. Processes sharing the file
+      re-read it (at most every `check_secs`), and rotate under a file lock, so replicas agree on the primary key.
+    """
+
+    def __init__(
+        self,
+        primary: str,
+        retired: List[str] = None,
+        rotated: datetime = None,
+        path: Optional[Path] = None,
+        rotate_after_days: int = 30,
+        max_retired: int = 2,
+        check_secs: float = 5.0,
+    ):
+        self.primary = primary
+        self.retired = retired or []
+        self.rotated = rotated or datetime.now()
+        self.path = path
+        self.rotate_after_days = rotate_after_days
+        self.max_retired = max_retired
+        self.check_secs = check_secs
+        self._stamp = self._file_stamp()
+        self._checked = time.monotonic()
+
+    @property
+    def keys(self) -> List[str]:
+        return [self.primary, *self.retired]
+
+    def fernet(self, salt: bytes, iterations: int) -> KeyringFernet:
+        return KeyringFernet(self, salt, iterations)
+
+    @classmethod
+    def load(cls) -> "CookieKeyring":
+        rotate_after_days = int(os.environ.get("MODULAR_AUTH_COOKIE_ROTATE_DAYS") or 30)
+        if env_keys := os.environ.get("MODULAR_AUTH_COOKIE_KEYS"):
+            primary, *retired = [x.strip() for x in env_keys.split(",") if x.strip()]
+            return cls(primary, retired, rotate_after_days=rotate_after_days)
+
+        path = Path(os.environ.get("MODULAR_AUTH_COOKIE_KEYRING") or DEFAULT_KEYRING_FILE)
+        with _file_lock(path):
+            keyring = cls(secrets.token_urlsafe(48), path=path, rotate_after_days=rotate_after_days)
+            try:
+                keyring.save(create=True)
+            except FileExistsError:
+                keyring._read()
+        keyring.rotate_if_due()
+        return keyring
+
+    def refresh(self) -> None:
+        """Adopts keys another process wrote to the keyring file (checked at most every `check_secs`)"""
+        if not self.path or time.monotonic() - self._checked < self.check_secs:
+            return
+        self._checked = time.monotonic()
+        if self._file_stamp() != self._stamp:
+            with _file_lock(self.path):
+                self._read()
+
+    def rotate_if_due(self) -> bool:
+        """Rotates the primary key once it is older than `rotate_after_days` (file keyrings only)
+        - Re-reads the file under its lock first, so a key another process just rotated in is adopted instead
+        """
+        if not self.path or not self.rotate_after_days or not self._due():
+            return False
+        with _file_lock(self.path):
+            self._read()
+            if not self._due():
+                return False
+            self.rotate()
+        return True
+
+    def rotate(self) -> None:
+        """Retires the current primary key and generates a new one
+        - Only the newest `max_retired` retired keys are kept; cookies encrypted with older keys stop validating
+        - File keyrings: call with the file lock held (see `rotate_if_due`)
+        """
+        self.retired = [self.primary, *self.retired][: self.max_retired]
+        self.primary = secrets.token_urlsafe(48)
+        self.rotated = datetime.now()
+        logger.info(f"Rotated cookie encryption key; {len(self.retired)} retired key(s) kept")
+        if self.path:
+            self.save()
+
+    def save(self, create: bool = False) -> None:
+        """Writes the keyring file atomically, readable by the owner only
+        - `create`: raises `FileExistsError` instead of replacing an existing file
+        """
+        data = {"primary": self.primary, "retired": self.retired, "rotated": self.rotated.isoformat()}
+        if create:
+            with open(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600), "w") as f:
+                json.dump(data, f)
+        else:
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(os.open(tmp_path, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600), "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        self._stamp = self._file_stamp()
+
+    def _read(self) -> None:
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        self.primary = data["primary"]
+        self.retired = data.get("retired", [])
+        self.rotated = datetime.fromisoformat(data["rotated"])
+        self._stamp = self._file_stamp()
+
+    def _due(self) -> bool:
+        return datetime.now() - self.rotated >= timedelta(days=self.rotate_after_days)
+
+    def _file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = self.path.stat()
+        except (AttributeError, OSError):
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+class KeyringCookieManager(EncryptedCookieManager):
+    """EncryptedCookieManager that encrypts with the keyring's primary key and decrypts with any of its keys"""
+
+    def __init__(self, *, keyring: CookieKeyring, prefix: str = ""):
+        super().__init__(prefix=prefix, password=keyring.primary)
+        self.keyring = keyring
+
+    def raw(self, name: str) -> Optional[str]:
+        """Encrypted value of a cookie, as stored in the browser (including queued writes)"""
+        return self._cookie_manager.get(name)
+
+    def decrypt(self, raw_value: str) -> Optional[str]:
+        try:
+            return self._decrypt(raw_value.encode("utf-8")).decode("utf-8")
+        except InvalidToken:
+            return None
+
+    def _encrypt(self, value):
+        self.keyring.rotate_if_due()
+        return super()._encrypt(value)
+
+    def _setup_fernet(self):
+        if self._fernet is not None:
+            return
+        key_params = self._get_key_params()
+        if not key_params:
+            key_params = self._initialize_new_key_params()
+        salt, iterations, _ = key_params
+        self._fernet = self.keyring.fernet(salt, iterations)
@@ -1,10 +1,15 @@
 import secrets
+import struct
+import time
 from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
 
 import diskcache
 import streamlit as st
 from loguru import logger
 
+from streamlit_modular_auth._core.context import AuthContext
+from streamlit_modular_auth._core.permissions import mask_from_bytes, mask_to_bytes
 from streamlit_modular_auth.protocols import CookieManager
 
 dc = diskcache.Cache("cache.db")
@@ -37,8 +42,11 @@ class DefaultAuthCookies:
                 user_cache["auth_token"] == local_token
                 and datetime.fromisoformat(user_cache["expires"]) >= datetime.now()
             ):
+                auth = AuthContext.load(st.session_state)
+                auth.username = local_username
+                auth.expires = datetime.fromisoformat(user_cache["expires"]).timestamp()
                 if local_groups := cookies.get("groups"):
-                    st.session_state["groups"] = local_groups.split(",")
+                    auth.set_groups(local_groups.split(","))
                 return True
             else:
                 st.error("Session expired...")
@@ -77,5 +85,129 @@ class DefaultAuthCookies:
         cookies.expire("auth_token")
         cookies.expire("auth_username")
         cookies.expire("groups")
-        if "groups" in st.session_state.keys():
-            st.session_state.pop("groups")
+        AuthContext.load(st.session_state).set_groups((), group_mask=0)
+
+
+class AuthPayload(NamedTuple):
+    username: str
+    token: bytes
+    expires: int
+    groups: List[str]
+    group_mask: int = 0
+
+
+class PackedAuthCookies:
+    """Stores the whole auth session (username, token, expiry, groups) in one binary-packed cookie
+    - One cookie, so one decrypt per rerun instead of one per `auth_token`/`auth_username`/`groups`
+    - Header (all versions): version (B), expires unix time (I), token (32s), username length, username
+    - Body: groups length, then comma-joined group names (v1/v3; storage without group ids, i.e. json storage)
+      or the group bitset (v2/v4, little-endian; when login set a group mask on the `AuthContext`)
+    - v3/v4 lengths are `H`; v1/v2 (`B` username/mask lengths, `H` groups length) are still read
+    - The token is still validated against the server-side session cache, so `expire` revokes it
+    """
+
+    COOKIE_NAME = "auth"
+    VERSION = 4
+    stores_groups = True
+    _header = struct.Struct(">BI32s")
+    _len = struct.Struct(">H")
+    _legacy_len = struct.Struct(">B")
+
+    def pack(self, payload: AuthPayload) -> bytes:
+        """Raises `ValueError` if the username or groups are too long to pack"""
+        username = payload.username.encode("utf-8")
+        if payload.group_mask:
+            version, body = 4, mask_to_bytes(payload.group_mask)
+        else:
+            version, body = 3, ",".join(payload.groups).encode("utf-8")
+        try:
+            lengths = self._len.pack(len(username)), self._len.pack(len(body))
+        except struct.error as e:
+            raise ValueError(f"Auth payload too long to pack: {e}") from e
+        return self._header.pack(version, payload.expires, payload.token) + lengths[0] + username + lengths[1] + body
+
+    def unpack(self, data: bytes) -> Optional[AuthPayload]:
+        try:
+            version, expires, token = self._header.unpack_from(data)
+            if version not in (1, 2, 3, 4):
+                return None
+            offset = self._header.size
+            username_len = self._len if version > 2 else self._legacy_len
+            (length,) = username_len.unpack_from(data, offset)
+            offset += username_len.size
+            username = data[offset : offset + length].decode("utf-8")
+            offset += length
+            body_len = self._legacy_len if version == 2 else self._len
+            (length,) = body_len.unpack_from(data, offset)
+            offset += body_len.size
+            body = data[offset : offset + length]
+            if version in (2, 4):
+                return AuthPayload(username, token, expires, [], mask_from_bytes(body))
+            groups = body.decode("utf-8")
+            return AuthPayload(username, token, expires, groups.split(",") if groups else [])
+        except (struct.error, UnicodeDecodeError):
+            return None
+
+    def check(self, cookies: CookieManager) -> bool:
+        """
+        Checks that the packed auth cookie exists, is unexpired, and matches the server-side session.
+        Args:
+            cookies (CookieManager): Initialized cookies manager provided by streamlit_modular_auth
+        Returns:
+            bool: If cookie is valid -> True; if not valid -> False
+        """
+        if not (data := cookies.get_packed(self.COOKIE_NAME)):
+            return False
+        if not (payload := self.unpack(data)) or payload.expires < time.time():
+            return False
+        user_cache = dc.get(payload.username)
+        if not user_cache or not secrets.compare_digest(user_cache["auth_token"], payload.token):
+            return False
+        auth = AuthContext.load(st.session_state)
+        auth.username = payload.username
+        auth.expires = payload.expires
+        if payload.groups or payload.group_mask:
+            auth.set_groups(payload.groups, group_mask=payload.group_mask)
+        return True
+
+    def set(self, username, cookies: CookieManager, expire_delay: int = 3600):
+        """
+        Sets the packed auth cookie; groups are taken from the session's `AuthContext` (group mask, else names)
+        when present.
+        Args:
+            username (str): Authorized user
+            cookies (CookieManager): Initialized cookies manager provided by streamlit_modular_auth
+            expire_delay (int): Time limit on valid token
+        Returns:
+            None
+        """
+        auth = AuthContext.load(st.session_state)
+        payload = AuthPayload(
+            username=username,
+            token=secrets.token_bytes(32),
+            expires=int(time.time()) + expire_delay,
+            groups=list(auth.groups or []),
+            group_mask=auth.group_mask,
+        )
+        dc.set(username, {"auth_token": payload.token}, expire=expire_delay)
+        # Too big for the cookie: try group names instead of the mask, then no groups (reloaded from storage)
+        for candidate in (payload, payload._replace(group_mask=0), payload._replace(groups=[], group_mask=0)):
+            try:
+                cookies.set_packed(self.COOKIE_NAME, self.pack(candidate))
+                return
+            except ValueError:
+                continue
+        logger.warning(f"Auth cookie for '{username}' is too large to store; the session won't survive a refresh")
+
+    def expire(self, cookies: CookieManager):
+        """
+        Expires the packed auth cookie and revokes its server-side session.
+        Args:
+            cookies (CookieManager): Initialized cookies manager provided by streamlit_modular_auth
+        Returns:
+            None
+        """
+        if (data := cookies.get_packed(self.COOKIE_NAME)) and (payload := self.unpack(data)):
+            dc.delete(payload.username)
+        cookies.expire(self.COOKIE_NAME)
+        AuthContext.load(st.session_state).set_groups((), group_mask=0)
@@ -1,4 +1,4 @@
-from typing import Optional, Protocol
+from typing import FrozenSet, Optional, Protocol
 
 from streamlit_modular_auth._cookie_manager import CookieManager
 
@@ -82,6 +82,23 @@ class UserStorage(Protocol):
         ...
 
 
+class GroupProvider(Protocol):
+    def get_groups(self, username: str) -> FrozenSet[str]:
+        """
+        Retrieve the permission groups for a user from storage.
+        - Used by `DefaultBaseView` instead of groups carried in cookies/session state, so group changes
+          apply without a new login
+        - Called on every permission check; implementations should cache (i.e., per-process with a TTL)
+
+        Args:
+            username (str): Authorized user
+
+        Returns:
+            FrozenSet[str]: group names; empty if the user has none or doesn't exist
+        """
+        ...
+
+
 class ForgotPasswordMessage(Protocol):
     def send(self, username: str, email: str, reset_password: str) -> None:
         """Trigger an email to the user containing the randomly generated password.
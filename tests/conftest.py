@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+import pytest
+import streamlit as st
+
+# Importing the package creates its cookie keyring, json storage and diskcache files in the working directory
+os.chdir(tempfile.mkdtemp(prefix="modular_auth_tests_"))
+
+
+class FakeSessionState(dict):
+    """Stands in for `st.session_state` outside a Streamlit script run"""
+
+    def __getattr__(self, key):
+        try:
+            return self[key]
+        except KeyError as e:
+            raise AttributeError(key) from e
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+
+@pytest.fixture
+def session_state(monkeypatch) -> FakeSessionState:
+    state = FakeSessionState()
+    monkeypatch.setattr(st, "session_state", state)
+    return state
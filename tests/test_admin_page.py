@@ -0,0 +1,31 @@
+import pytest
+from sqlalchemy import create_engine, event
+
+from streamlit_modular_auth import ModularAuth
+from streamlit_modular_auth._apps.admin.page import admin_page
+from streamlit_modular_auth._apps.admin.storage import DefaultDBUserStorage
+from streamlit_modular_auth._apps.admin.views import AdminView
+from streamlit_modular_auth._core.context import AuthContext
+
+
+@pytest.fixture
+def admin_view(session_state, tmp_path) -> AdminView:
+    engine = create_engine(f"sqlite:///{tmp_path / 'admin.sqlite'}")
+    storage = DefaultDBUserStorage()
+    storage.db = engine
+    storage.init_storage()
+    app = ModularAuth(db_engine=engine)
+    app.state = session_state
+    auth = AuthContext.load(session_state)
+    auth.login("admin")
+    auth.set_groups(["admin"])
+    return AdminView(app)
+
+
+def test_admin_render_checks_out_one_connection(admin_view):
+    checkouts = []
+    event.listen(admin_view.db, "checkout", lambda *args: checkouts.append(args))
+    for _ in range(2):
+        checkouts.clear()
+        admin_page(admin_view)
+        assert len(checkouts) == 1  # every helper joins the render's session
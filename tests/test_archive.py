@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+
+from streamlit_modular_auth._apps.admin.archive import archive_inactive_users
+from streamlit_modular_auth._apps.admin.migrations import migrate
+from streamlit_modular_auth._apps.admin.models import User, create_db_and_tables
+
+
+def test_upgrade_counts_inactivity_of_unstamped_users_from_the_migration(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'archive.sqlite'}")
+    create_db_and_tables(engine)
+    long_ago = datetime.now() - timedelta(days=365)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User.__table__).values(
+                username="old",
+                email="old@example.com",
+                first_name="Old",
+                last_name="User",
+                hashed_password="",
+                active=False,
+                create_date=long_ago,
+                update_date=long_ago,  # deactivated before deactivation stamped `update_date`
+            )
+        )
+    migrate(engine)
+
+    assert archive_inactive_users(engine, inactive_days=90) == 0
+    assert archive_inactive_users(engine, inactive_days=0) == 1
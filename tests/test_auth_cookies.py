@@ -0,0 +1,41 @@
+import secrets
+import struct
+
+from streamlit_modular_auth._core.context import AuthContext
+from streamlit_modular_auth.handlers.auth_cookies import AuthPayload, PackedAuthCookies
+
+
+class FakeCookies:
+    PACKED_BUDGET = 2048
+
+    def __init__(self):
+        self.packed = {}
+
+    def set_packed(self, name, payload):
+        if len(payload) > self.PACKED_BUDGET:
+            raise ValueError("over budget")
+        self.packed[name] = payload
+
+
+def test_pack_long_username_and_high_group_ids():
+    packed = PackedAuthCookies()
+    for payload in (
+        AuthPayload("u" * 300, secrets.token_bytes(32), 1, ["admin", "users"]),
+        AuthPayload("user", secrets.token_bytes(32), 1, [], group_mask=1 << 2040 | 1),
+    ):
+        assert packed.unpack(packed.pack(payload)) == payload
+
+
+def test_unpack_v2_cookie():
+    token = secrets.token_bytes(32)
+    data = struct.pack(">BI32sB", 2, 1, token, 3) + b"bob" + struct.pack(">B", 2) + (513).to_bytes(2, "little")
+    assert PackedAuthCookies().unpack(data) == AuthPayload("bob", token, 1, [], group_mask=513)
+
+
+def test_set_falls_back_to_group_names(session_state):
+    auth = AuthContext.load(session_state)
+    auth.set_groups(["admin"], group_mask=1 << 20000)
+    cookies = FakeCookies()
+    PackedAuthCookies().set("user", cookies)
+    payload = PackedAuthCookies().unpack(cookies.packed["auth"])
+    assert (payload.groups, payload.group_mask) == (["admin"], 0)
@@ -0,0 +1,38 @@
+from streamlit_modular_auth._core.context import AuthContext
+
+
+def test_logged_in_is_mirrored(session_state):
+    auth = AuthContext.load(session_state)
+    assert session_state["LOGGED_IN"] is False
+    auth.login("user")
+    assert session_state["LOGGED_IN"] is True
+    auth.clear()
+    assert session_state["LOGGED_IN"] is False
+
+
+def test_plugin_keys_are_adopted(session_state):
+    session_state["modular_auth.groups"] = ["ops"]
+    auth = AuthContext.load(session_state)
+    assert auth.groups == frozenset({"ops"})
+    assert "modular_auth.groups" not in session_state
+
+
+def test_app_keys_are_read_but_kept(session_state):
+    session_state["groups"] = ["ops"]
+    auth = AuthContext.load(session_state)
+    assert auth.groups == frozenset({"ops"})
+    assert session_state["groups"] == ["ops"]
+
+    auth.set_groups(["admin"])
+    AuthContext.load(session_state)
+    assert auth.groups == frozenset({"admin"})  # unchanged app key isn't read again
+    session_state["groups"] = ["dev"]
+    assert AuthContext.load(session_state).groups == frozenset({"dev"})
+
+
+def test_adopted_group_mask_drops_cached_decisions(session_state):
+    auth = AuthContext.load(session_state)
+    auth.decisions[("user", frozenset({"ops"}))] = False
+    session_state["modular_auth.group_mask"] = 0b10
+    auth = AuthContext.load(session_state)
+    assert (auth.group_mask, auth.decisions, auth.groups) == (0b10, {}, None)
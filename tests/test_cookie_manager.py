@@ -0,0 +1,47 @@
+from streamlit_modular_auth import DefaultBaseView, ModularAuth
+from streamlit_modular_auth._cookie_manager import CookieManager
+from streamlit_modular_auth._core.context import AuthContext
+
+
+class Browser:
+    """Saved cookies; the cookie component reports them on the run after it is first rendered"""
+
+    def __init__(self):
+        self.jar = {}
+        self.mounted = False
+
+
+class FakeComponentCookies:
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.reported = dict(browser.jar) if browser.mounted else None
+        self.queued = {}
+        browser.mounted = True
+
+    def ready(self):
+        return self.reported is not None
+
+    def __setitem__(self, name, value):
+        self.queued[name] = value
+
+    def save(self):
+        self.browser.jar.update(self.queued)
+        self.queued.clear()
+
+
+def test_login_cookies_saved_on_logged_in_rerun(session_state):
+    browser = Browser()
+    cookies = CookieManager(lambda: FakeComponentCookies(browser), keyring=None, prefix="")
+    app = ModularAuth(cookies=cookies)
+    app.state = session_state
+
+    # Login callback: the component isn't ready yet, so the auth cookie is deferred
+    with cookies.transaction():
+        cookies.set("auth", "token")
+    AuthContext.load(session_state).login("user")
+    assert browser.jar == {}
+
+    # Rerun: logged in, so no cookie is read, but the page's permission check saves the deferred cookie
+    assert DefaultBaseView(app).check_permissions() is True
+    assert browser.jar == {"auth": "token"}
+    assert CookieManager.DEFERRED_KEY not in session_state
@@ -0,0 +1,21 @@
+import threading
+
+from sqlalchemy import create_engine, event, text
+
+from streamlit_modular_auth._apps.admin.db import _count_query, count_queries
+
+
+def test_count_queries_counts_own_context_with_one_permanent_listener():
+    engine = create_engine("sqlite://")
+    other = threading.Thread(target=lambda: [engine.connect().execute(text("SELECT 1")) for _ in range(50)])
+    with count_queries(engine) as outer:
+        other.start()
+        with count_queries(engine) as inner, engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        other.join()
+    with count_queries(engine):
+        pass
+
+    assert (outer.count, inner.count) == (1, 1)
+    assert event.contains(engine, "before_cursor_execute", _count_query)
+    assert len(engine.dispatch.before_cursor_execute) == 1
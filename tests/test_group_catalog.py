@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from streamlit_modular_auth._apps.admin.aio import AsyncGroup
+from streamlit_modular_auth._apps.admin.models import Group, create_db_and_tables
+
+
+def test_concurrent_async_loads_dont_block_the_event_loop(tmp_path):
+    path = tmp_path / "groups.sqlite"
+    engine = create_engine(f"sqlite:///{path}")
+    create_db_and_tables(engine)
+    for name in ("admin", "staff"):
+        Group.create(name, engine)
+
+    async def load_concurrently():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        try:
+            results.extend(await asyncio.gather(*(AsyncGroup.get_all(async_engine) for _ in range(8))))
+        finally:
+            await async_engine.dispose()
+
+    # A blocked event loop never lets `asyncio.wait_for` fire, so the loop runs on a thread the test can give up on
+    results = []
+    loop = threading.Thread(target=asyncio.run, args=(load_concurrently(),), daemon=True)
+    loop.start()
+    loop.join(10)
+    assert not loop.is_alive(), "event loop blocked"
+    assert all(sorted(x.name for x in groups) == ["admin", "staff"] for groups in results)
+
+
+def test_each_database_has_its_own_catalog(tmp_path):
+    engines = [create_engine(f"sqlite:///{tmp_path / name}.sqlite") for name in ("a", "b")]
+    for engine, name in zip(engines, ("alpha", "beta")):
+        create_db_and_tables(engine)
+        Group.create(name, engine)
+    Group.create("gamma", engines[1])
+
+    assert [x.name for x in Group.get_all(engines[0])] == ["alpha"]
+    assert [x.name for x in Group.get_all(engines[1])] == ["beta", "gamma"]
+    assert Group.get_bits(engines[1]).ids == {"beta": 1, "gamma": 2}
+    assert (Group.get_version(engines[0]), Group.get_version(engines[1])) == (1, 2)
@@ -0,0 +1,33 @@
+from sqlalchemy import create_engine, create_mock_engine, func
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+
+from streamlit_modular_auth._apps.admin.models import USER_LOWER_INDEXES, User, _prefix_range
+from streamlit_modular_auth._apps.admin.storage import DefaultDBUserStorage
+
+
+def test_user_prefix_filter(tmp_path):
+    storage = DefaultDBUserStorage()
+    storage.db = engine = create_engine(f"sqlite:///{tmp_path / 'users.sqlite'}")
+    storage.init_storage()
+    for username in ("a-b", "ab", "abc", "a_b", "a/b", "z\U0010ffff", "z\U0010ffffy"):
+        User.create(username, username, f"{username}@example.com", username, "", engine)
+
+    def usernames(prefix):
+        users, _ = User.get_page(engine, limit=10, prefix=prefix)
+        return sorted(x.username for x in users)
+
+    assert usernames("ab") == ["ab", "abc"]
+    assert usernames("a_") == ["a_b"]
+    assert usernames("a/") == ["a/b"]
+    assert usernames("z\U0010ffff") == ["z\U0010ffff", "z\U0010ffffy"]
+
+
+def test_postgres_prefix_is_an_escaped_like_on_pattern_ops_indexes():
+    engine = create_mock_engine("postgresql://", None)
+    dialect = postgresql.dialect()
+    condition = _prefix_range(func.lower(User.username), "a_b%", engine)
+    compiled = condition.compile(dialect=dialect)
+    assert str(compiled) == "lower(streamlit_users.username) LIKE %(lower_1)s ESCAPE '/'"
+    assert compiled.params == {"lower_1": "a/_b/%%"}
+    assert all("text_pattern_ops" in str(CreateIndex(x).compile(dialect=dialect)) for x in USER_LOWER_INDEXES)
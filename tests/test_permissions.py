@@ -0,0 +1,48 @@
+from sqlalchemy import create_engine
+
+from streamlit_modular_auth import DefaultBaseView, ModularAuth
+from streamlit_modular_auth._apps.admin.models import Group, User
+from streamlit_modular_auth._apps.admin.storage import DefaultDBUserStorage
+from streamlit_modular_auth._core.context import AuthContext
+
+
+class Poems(DefaultBaseView):
+    name = "poems"
+    groups = ["poems"]
+
+
+def test_million_permission_checks_leave_view_groups_unchanged(session_state):
+    app = ModularAuth()
+    app.state = session_state
+    view = Poems(app)
+    auth = AuthContext.load(session_state)
+    auth.login("reader")
+    auth.set_groups(["poems"])
+
+    for _ in range(1_000_000):
+        view.check_group_access(view.groups)
+
+    assert Poems.groups == ["poems"]
+    assert Poems._required_groups == frozenset({"poems", "admin"})
+    assert view.check_group_access(view.groups) is True
+    auth.set_groups(["prose"])
+    assert view.check_group_access(view.groups) is False
+
+
+def test_session_groups_survive_a_groups_reload(session_state, tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'groups.sqlite'}")
+    storage = DefaultDBUserStorage()
+    storage.db = engine
+    storage.init_storage()
+    Group.create("ops", engine)
+    app = ModularAuth(db_engine=engine)
+    app.state = session_state
+    view = Poems(app)
+    AuthContext.load(session_state).login("reader")
+
+    view.add_session_groups("poems")
+    assert view.check_group_access(view.groups) is True
+    User.add_group("admin", "ops", engine)  # another user's change moves the groups version
+
+    assert view.check_group_access(view.groups) is True
+    assert view.auth_context.groups == {"poems"}
@@ -15,8 +15,8 @@ if logged_in is True:
     st.markdown("Your Streamlit Application Begins here!")
 
     if st.button("Add Poems"):
-        view.state["groups"].append("poems")
-        view.cookies.set("groups", ",".join(view.state["groups"]))
+        view.add_session_groups("poems")
+        view.cookies.set("groups", ",".join(view.auth_context.groups))
         st.write("Permissions for poems group added")
 
     st.write(view.state)
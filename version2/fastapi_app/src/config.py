@@ -47,6 +47,8 @@ class config:
     PROD_DB_STR = os.environ.get("DATABASE_URL")
 
     POSTGRES_STR = shared_config["db_connect_str"]
+    # - Compiled SQL statements cached per engine (hot lookups are lambda statements; see `DBUser`)
+    DB_QUERY_CACHE_SIZE = int(os.environ.get("DB_QUERY_CACHE_SIZE") or 500)
 
     FASTAPI_SECRET_KEY = os.environ.get("FASTAPI_SECRET_KEY") or shared_config["fastapi_secret_key"]
     FASTAPI_ALGORITHM = os.environ.get("FASTAPI_ALGORITHM") or shared_config["fastapi_algorithm"]
@@ -10,7 +10,7 @@ class Base(DeclarativeBase):
     pass
 
 
-engine = create_engine(config.TEST_DB_STR, pool_recycle=3600, echo=True)
+engine = create_engine(config.TEST_DB_STR, pool_recycle=3600, echo=True, query_cache_size=config.DB_QUERY_CACHE_SIZE)
 
 if __name__ == "__main__":
     Base.metadata.create_all(engine)
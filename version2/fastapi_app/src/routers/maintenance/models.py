@@ -4,8 +4,9 @@ from fastapi import HTTPException
 from loguru import logger
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
-from sqlalchemy import Column, ForeignKey, Table, select
+from sqlalchemy import Column, ForeignKey, Table, insert, lambda_stmt, literal, select, update
 from sqlalchemy.orm import Mapped, Session, mapped_column, relationship
+from sqlalchemy.sql.lambdas import StatementLambdaElement
 
 from src.database import db
 
@@ -73,87 +74,95 @@ class DBUser(db.Base):
 
     @staticmethod
     def create(api_user: APIUserAccount) -> APIUserReturn:
-        user_email_stmt = stmt = select(DBUser).filter(
-            (DBUser.username == api_user.username) | (DBUser.email == api_user.email)
+        duplicate = DBUser.username == api_user.username
+        if api_user.email:
+            duplicate = duplicate | (DBUser.email == api_user.email)
+        values = {
+            "username": api_user.username,
+            "email": api_user.email,
+            "full_name": api_user.full_name,
+            "disabled": bool(api_user.disabled),
+            "hashed_password": pwd_context.hash(api_user.password),
+        }
+        # One statement: INSERT ... SELECT ... WHERE NOT EXISTS (the table has no unique constraint to conflict on)
+        columns = DBUser.__table__.c
+        new_row = select(*[literal(v, columns[k].type) for k, v in values.items()]).where(
+            ~select(DBUser.id).where(duplicate).exists()
         )
-        user_stmt = select(DBUser).filter(DBUser.username == api_user.username)
+        stmt = insert(DBUser).from_select(list(values), new_row)
 
         with Session(db.engine) as session:
-            stmt = user_email_stmt if api_user.email else user_stmt
-            if existing_user := session.execute(stmt).first():
-                logger.warning(f"User already exists: {existing_user}")
+            dialect = session.get_bind().dialect
+            if dialect.insert_returning and dialect.name != "oracle":  # Oracle can't RETURNING from INSERT ... SELECT
+                user_id = session.execute(stmt.returning(DBUser.id)).scalar()
+            elif session.execute(stmt).rowcount:
+                user_id = session.execute(select(DBUser.id).where(DBUser.username == api_user.username)).scalar()
+            else:
+                user_id = None
+            if not user_id:
+                logger.warning(f"User already exists: {api_user.username}")
                 return
 
-            db_user = DBUser(
-                username=api_user.username,
-                email=api_user.email,
-                full_name=api_user.full_name,
-                disabled=api_user.disabled,
-                hashed_password=pwd_context.hash(api_user.password),
-            )
-
+            access_l = None
             if api_user.scopes:
-                access_stmt = select(DBAccess).filter(DBAccess.name.in_(api_user.scopes))
-                access = session.execute(access_stmt).all()
-                for a in access:
-                    db_user.access.append(a[0])
-
-            session.add(db_user)
+                access_stmt = select(DBAccess.id, DBAccess.name).filter(DBAccess.name.in_(api_user.scopes))
+                if access := session.execute(access_stmt).all():
+                    session.execute(insert(enabled_access), [{"user_id": user_id, "access_id": a.id} for a in access])
+                    access_l = [a.name for a in access]
             session.commit()
-            new_user = session.execute(stmt).unique().one()
 
-            new_user = new_user[0]
-            if new_user.access:
-                access_l = [n.name for n in new_user.access]
-            else:
-                access_l = None
-            return APIUserReturn(
-                action="CREATED",
-                user_info=APIUserAccount(
-                    username=new_user.username,
-                    email=new_user.email,
-                    full_name=new_user.full_name,
-                    disabled=new_user.disabled,
-                    scopes=access_l,
-                    password="<converted-to-hashed-password>",  # noqa
-                ),
-            )
+        return APIUserReturn(
+            action="CREATED",
+            user_info=APIUserAccount(
+                username=values["username"],
+                email=values["email"],
+                full_name=values["full_name"],
+                disabled=values["disabled"],
+                scopes=access_l,
+                password="<converted-to-hashed-password>",  # noqa
+            ),
+        )
 
     @staticmethod
     def update(api_user: APIUpdateAccount) -> APIUpdateAccount:
-        password_updated = False
-
-        stmt = select(DBUser).filter(DBUser.username == api_user.username)
+        values = {}
+        if api_user.disabled is not None:
+            values["disabled"] = api_user.disabled
+        if api_user.full_name is not None:
+            values["full_name"] = api_user.full_name
+        if api_user.password is not None:
+            values["hashed_password"] = pwd_context.hash(api_user.password)
+
+        returned = (DBUser.username, DBUser.full_name, DBUser.disabled)
+        stmt = select(*returned).where(DBUser.username == api_user.username)
         with Session(db.engine) as session:
-            db_user = session.execute(stmt).first()
-            if not db_user:
-                logger.warning(f"User not found: {api_user}")
-                return
-
-            db_user = db_user[0]
-            if api_user.disabled is not None:
-                db_user.disabled = api_user.disabled
-            if api_user.full_name is not None:
-                db_user.full_name = api_user.full_name
-            if api_user.password is not None:
-                password_updated = True
-                db_user.hashed_password = pwd_context.hash(api_user.password)
-
-            session.add(db_user)
-            session.commit()
-            updated_user = session.execute(stmt).unique()
-
-            updated_user = updated_user[0]
-            return APIUpdateAccount(
-                username=updated_user.username,
-                full_name=updated_user.full_name,
-                disabled=updated_user.disabled,
-                password="<password-hash-updated>" if password_updated is True else "<password-hash-unchanged>",
-            )
+            if values:
+                # One statement: UPDATE ... RETURNING where supported, otherwise UPDATE then SELECT
+                update_stmt = update(DBUser).where(DBUser.username == api_user.username).values(**values)
+                options = {"synchronize_session": False}
+                if session.get_bind().dialect.update_returning:
+                    updated_user = session.execute(update_stmt.returning(*returned), execution_options=options).first()
+                elif session.execute(update_stmt, execution_options=options).rowcount:
+                    updated_user = session.execute(stmt).first()
+                else:
+                    updated_user = None
+                session.commit()
+            else:
+                updated_user = session.execute(stmt).first()
+
+        if not updated_user:
+            logger.warning(f"User not found: {api_user}")
+            return
+        return APIUpdateAccount(
+            username=updated_user.username,
+            full_name=updated_user.full_name,
+            disabled=updated_user.disabled,
+            password="<password-hash-updated>" if "hashed_password" in values else "<password-hash-unchanged>",
+        )
 
     @staticmethod
     def remove_scope(username: str, scope: str):
-        stmt_user = select(DBUser).filter(DBUser.username == username)
+        stmt_user = _user_stmt(username)
         stmt_scope = select(DBAccess).filter(DBAccess.name == scope)
 
         with Session(db.engine) as session:
@@ -168,8 +177,7 @@ class DBUser(db.Base):
                 session.add(db_user)
                 session.commit()
 
-                stmt_check = select(DBUser).where(DBUser.username == username)
-                updated_user = session.execute(stmt_check).first()
+                updated_user = session.execute(stmt_user).first()
                 if scope in [u.name for u in updated_user[0].access]:
                     raise HTTPException(status_code=500, detail="Scope remove operation failed.")
             except ValueError as e:
@@ -179,7 +187,7 @@ class DBUser(db.Base):
 
     @staticmethod
     def add_scope(username: str, scope: str):
-        stmt_user = select(DBUser).filter(DBUser.username == username)
+        stmt_user = _user_stmt(username)
         stmt_scope = select(DBAccess).filter(DBAccess.name == scope)
 
         with Session(db.engine) as session:
@@ -200,14 +208,13 @@ class DBUser(db.Base):
             session.add(db_user)
             session.commit()
 
-            stmt_check = select(DBUser).where(DBUser.username == username)
-            updated_user = session.execute(stmt_check).first()
+            updated_user = session.execute(stmt_user).first()
             if scope not in [u.name for u in updated_user[0].access]:
                 raise HTTPException(status_code=500, detail="Scope add operation failed.")
 
     @staticmethod
     def delete(api_user: APIUserAccount) -> bool:
-        stmt = select(DBUser).filter(DBUser.username == api_user.username)
+        stmt = _user_stmt(api_user.username)
         with Session(db.engine) as session:
             db_user = session.execute(stmt).first()
             if not db_user:
@@ -248,7 +255,7 @@ class DBUser(db.Base):
 
     @staticmethod
     def get(username: str, api_return: bool = False) -> Union["DBUser", APIUserAccount]:
-        stmt = select(DBUser).where(DBUser.username == username)
+        stmt = _user_stmt(username)
         with Session(db.engine) as session:
             if db_user := session.execute(stmt).first():
                 db_user = db_user[0]
@@ -318,3 +325,8 @@ class DBAccess(db.Base):
         with Session(db.engine) as session:
             db_scopes = session.execute(stmt).unique()
             return list(db_scopes)
+
+
+def _user_stmt(username: str) -> StatementLambdaElement:
+    """User by username (token auth's lookup); a lambda statement, so repeat calls only bind a new `username`"""
+    return lambda_stmt(lambda: select(DBUser).where(DBUser.username == username))